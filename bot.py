@@ -7,10 +7,12 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
 from config import BOT_TOKEN, ENCRYPTION_KEY, ALLOWED_USERS
-from database import init_db
+from database import init_db, close_db
 from handlers import servers_router, stats_router, hosting_router
 from services.scheduler import setup_scheduler
 from services.monitoring import MonitoringService
+from services.delivery import DeliveryService
+from services.outbox import OutboxDrainer
 from middleware import AccessControlMiddleware, RateLimitMiddleware
 
 logging.basicConfig(
@@ -32,46 +34,73 @@ async def main():
     if not ALLOWED_USERS:
         logger.warning("ALLOWED_USERS not set! Bot is open to everyone.")
 
-    # Инициализация БД
+    # Инициализация БД; при ошибке init_db() сам закрывает пул
     await init_db()
     logger.info("Database initialized")
 
-    # Создание бота и диспетчера
-    bot = Bot(
-        token=BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-    )
-    dp = Dispatcher()
-
-    # Middleware безопасности
-    dp.message.middleware(AccessControlMiddleware())
-    dp.message.middleware(RateLimitMiddleware())
-    dp.callback_query.middleware(AccessControlMiddleware())
-    dp.callback_query.middleware(RateLimitMiddleware())
-
-    # Регистрация роутеров
-    dp.include_router(servers_router)
-    dp.include_router(stats_router)
-    dp.include_router(hosting_router)
-
-    # Настройка планировщика напоминаний
-    scheduler = setup_scheduler(bot)
-    scheduler.start()
-    logger.info("Scheduler started")
-
-    # Запуск мониторинга
-    monitoring = MonitoringService(bot)
-    await monitoring.start()
-    logger.info("Monitoring service started")
-
+    # Соединения пула живут в потоках aiosqlite и не дают процессу завершиться,
+    # поэтому всё после init_db() — под try, а сервисы останавливаются,
+    # только если успели запуститься
+    bot = None
+    delivery = None
+    outbox = None
+    scheduler = None
+    monitoring = None
     try:
+        # Создание бота и диспетчера
+        bot = Bot(
+            token=BOT_TOKEN,
+            default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+        )
+        dp = Dispatcher()
+
+        # Middleware безопасности
+        dp.message.middleware(AccessControlMiddleware())
+        dp.message.middleware(RateLimitMiddleware())
+        dp.callback_query.middleware(AccessControlMiddleware())
+        dp.callback_query.middleware(RateLimitMiddleware())
+
+        # Регистрация роутеров
+        dp.include_router(servers_router)
+        dp.include_router(stats_router)
+        dp.include_router(hosting_router)
+
+        # Очередь исходящих сообщений с учётом лимитов Telegram
+        delivery = DeliveryService(bot)
+        await delivery.start()
+        # Уведомления сначала сохраняются в базе, затем отправляются отсюда
+        outbox = OutboxDrainer(delivery)
+        await outbox.start()
+
+        # Настройка планировщика напоминаний
+        scheduler = setup_scheduler(outbox)
+        scheduler.start()
+        logger.info("Scheduler started")
+
+        # Запуск мониторинга
+        monitoring = MonitoringService(outbox)
+        await monitoring.start()
+        logger.info("Monitoring service started")
+
+        # Хэндлеры получают сервис аргументом monitoring и обновляют расписание сразу
+        dp["monitoring"] = monitoring
+
         logger.info("Bot starting...")
         await dp.start_polling(bot)
     finally:
-        scheduler.shutdown()
-        await monitoring.stop()
-        await bot.session.close()
-
+        try:
+            if scheduler is not None and scheduler.running:
+                scheduler.shutdown()
+            if monitoring is not None and monitoring.running:
+                await monitoring.stop()
+            if outbox is not None and outbox.running:
+                await outbox.stop()
+            if delivery is not None and delivery.running:
+                await delivery.stop()
+        finally:
+            await close_db()
+            if bot is not None:
+                await bot.session.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -9,8 +9,52 @@ DATABASE_PATH = os.getenv("DATABASE_PATH", "servers.db")
 # Настройки по умолчанию
 DEFAULT_REMINDER_DAYS = 7
 DEFAULT_REMINDER_TIME = "10:00"
+# Часовой пояс напоминаний для пользователей, которые его не выбрали
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Europe/Moscow")
 MONITORING_INTERVAL_MINUTES = 5
 MONITORING_TIMEOUT_SECONDS = 10
+# Параллельные проверки мониторинга: всего и на одного пользователя
+MONITORING_MAX_CONCURRENCY = int(os.getenv("MONITORING_MAX_CONCURRENCY", "100"))
+MONITORING_MAX_PER_USER = int(os.getenv("MONITORING_MAX_PER_USER", "10"))
+# HTTP-проверки: соединений на один хост и время жизни DNS-кэша, сек
+MONITORING_HTTP_PER_HOST = int(os.getenv("MONITORING_HTTP_PER_HOST", "4"))
+MONITORING_DNS_CACHE_SECONDS = int(os.getenv("MONITORING_DNS_CACHE_SECONDS", "300"))
+# TCP-проверки IP: порты по умолчанию и задержка перед запуском следующей попытки, мс
+MONITORING_DEFAULT_PORTS = [
+    int(x) for x in os.getenv("MONITORING_DEFAULT_PORTS", "443,80,22").split(",") if x.strip()
+]
+MONITORING_PORT_STAGGER_MS = int(os.getenv("MONITORING_PORT_STAGGER_MS", "250"))
+# Смена статуса подтверждается N результатами из последних M проверок;
+# до подтверждения цель перепроверяется через MONITORING_REPROBE_SECONDS,
+# удваивая паузу, но не реже интервала мониторинга
+# (N больше M никогда не набрать, поэтому N ограничивается M)
+MONITORING_CONFIRM_M = max(1, int(os.getenv("MONITORING_CONFIRM_M", "3")))
+MONITORING_CONFIRM_N = min(max(1, int(os.getenv("MONITORING_CONFIRM_N", "2"))), MONITORING_CONFIRM_M)
+MONITORING_REPROBE_SECONDS = int(os.getenv("MONITORING_REPROBE_SECONDS", "10"))
+# Исходящие сообщения: общий темп (лимит Telegram ~30 в секунду), пауза
+# между сообщениями в один чат, число попыток и время на досылку при остановке
+DELIVERY_GLOBAL_RATE = int(os.getenv("DELIVERY_GLOBAL_RATE", "25"))
+DELIVERY_CHAT_INTERVAL_MS = int(os.getenv("DELIVERY_CHAT_INTERVAL_MS", "1000"))
+DELIVERY_MAX_ATTEMPTS = int(os.getenv("DELIVERY_MAX_ATTEMPTS", "3"))
+DELIVERY_DRAIN_SECONDS = int(os.getenv("DELIVERY_DRAIN_SECONDS", "10"))
+# Очередь уведомлений в базе: опрос, размер пачки, попытки доставки
+# и сколько дней хранить отправленные записи (для защиты от повторов)
+OUTBOX_POLL_SECONDS = int(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "100"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_KEEP_DAYS = int(os.getenv("OUTBOX_KEEP_DAYS", "3"))
+# Смены статуса одного пользователя за это окно приходят одним сообщением, сек
+MONITORING_DIGEST_SECONDS = int(os.getenv("MONITORING_DIGEST_SECONDS", "20"))
+# Как часто сверять расписание мониторинга с базой, мин
+MONITORING_SYNC_MINUTES = int(os.getenv("MONITORING_SYNC_MINUTES", "15"))
+# Результаты проверок пишутся в базу пачками: раз в N секунд или по накоплении
+MONITORING_FLUSH_SECONDS = int(os.getenv("MONITORING_FLUSH_SECONDS", "30"))
+MONITORING_FLUSH_BATCH = int(os.getenv("MONITORING_FLUSH_BATCH", "500"))
+# Сколько дней хранить сырые результаты проверок
+MONITORING_HISTORY_DAYS = int(os.getenv("MONITORING_HISTORY_DAYS", "7"))
+# Сколько дней хранить часовые и суточные агрегаты (аптайм, задержка)
+MONITORING_HOURLY_RETENTION_DAYS = int(os.getenv("MONITORING_HOURLY_RETENTION_DAYS", "7"))
+MONITORING_DAILY_RETENTION_DAYS = int(os.getenv("MONITORING_DAILY_RETENTION_DAYS", "90"))
 
 # Курсы валют к рублю
 EXCHANGE_RATES = {
@@ -31,4 +75,21 @@ ALLOWED_USERS = [int(x) for x in os.getenv("ALLOWED_USERS", "").split(",") if x.
 
 # Лимиты
 MAX_SERVERS_PER_USER = int(os.getenv("MAX_SERVERS_PER_USER", "100"))
+# Серверов на одной странице списка
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "20"))
 RATE_LIMIT_SECONDS = float(os.getenv("RATE_LIMIT_SECONDS", "0.5"))  # Минимум между сообщениями
+
+# === БАЗА ДАННЫХ ===
+
+# Количество соединений для чтения (писатель всегда один)
+DB_POOL_READERS = int(os.getenv("DB_POOL_READERS", "4"))
+# Сколько ждать освобождения блокировки SQLite, мс
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+# Окно группировки записей в одну транзакцию, мс
+DB_WRITE_BATCH_WINDOW_MS = int(os.getenv("DB_WRITE_BATCH_WINDOW_MS", "5"))
+# Максимум мутаций в одной транзакции
+DB_WRITE_BATCH_MAX = int(os.getenv("DB_WRITE_BATCH_MAX", "200"))
+# Сколько пользователей держать в кэше подсказок мастера добавления сервера
+DB_FACETS_CACHE_SIZE = int(os.getenv("DB_FACETS_CACHE_SIZE", "1000"))
+# Сколько серверов всего держать в кэше чтения серверов по пользователям
+DB_SERVER_CACHE_MAX = int(os.getenv("DB_SERVER_CACHE_MAX", "20000"))
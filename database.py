@@ -1,11 +1,26 @@
+import asyncio
+import bisect
+import logging
 import aiosqlite
-from datetime import datetime, date
-from typing import Optional
-from dataclasses import dataclass
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, date, timedelta
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Collection, Optional, Sequence
+from dataclasses import dataclass, field
 
-from config import DATABASE_PATH, MAX_SERVERS_PER_USER
+from config import (
+    DATABASE_PATH, MAX_SERVERS_PER_USER, DB_POOL_READERS, DB_BUSY_TIMEOUT_MS,
+    DB_WRITE_BATCH_WINDOW_MS, DB_WRITE_BATCH_MAX, DEFAULT_REMINDER_DAYS,
+    DEFAULT_REMINDER_TIME, DEFAULT_TIMEZONE, DB_FACETS_CACHE_SIZE, DB_SERVER_CACHE_MAX,
+    LIST_PAGE_SIZE
+)
 from security import encrypt_api_key, decrypt_api_key
 
+if TYPE_CHECKING:
+    from services.hosting_api import HostingServer
+
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class Server:
@@ -24,6 +39,7 @@ class Server:
     tags: Optional[str]
     is_monitoring: bool
     created_at: datetime
+    monitoring_ports: Optional[str] = None  # "443,8080"; None — порты по умолчанию
 
 
 @dataclass
@@ -31,6 +47,7 @@ class UserSettings:
     user_id: int
     reminder_days: int
     reminder_time: str
+    timezone: str = DEFAULT_TIMEZONE
 
 
 @dataclass
@@ -42,80 +59,875 @@ class HostingAPIKey:
     created_at: datetime
 
 
+@dataclass
+class MonitorState:
+    """Последний известный статус сервера в мониторинге."""
+    server_id: int
+    is_online: bool
+    changed_at: datetime  # UTC, когда статус последний раз изменился
+    checked_at: datetime  # UTC, последняя проверка
+    last_port: Optional[int] = None  # TCP-порт, ответивший последним
+
+
+@dataclass
+class MonitorCheck:
+    """Результат одной проверки мониторинга."""
+    server_id: int
+    checked_at: datetime  # UTC
+    is_online: bool
+    latency_ms: Optional[float] = None
+    port: Optional[int] = None
+    http_status: Optional[int] = None
+
+
+@dataclass
+class UptimeRollup:
+    """Агрегат проверок сервера за час или сутки."""
+    server_id: int
+    period: str  # hour, day
+    bucket_start: datetime  # UTC
+    checks: int
+    up: int
+    min_ms: Optional[float]
+    avg_ms: Optional[float]
+    p95_ms: Optional[float]
+
+
+@dataclass
+class UptimeSummary:
+    """SLA сервера для отображения."""
+    server_id: int
+    uptime_24h: Optional[float]  # %, None — ещё нет данных
+    uptime_30d: Optional[float]
+    avg_ms_24h: Optional[float]
+    p95_ms_24h: Optional[float]
+
+
+@dataclass
+class ServerPage:
+    """Страница списка серверов."""
+    servers: list[Server]
+    has_prev: bool
+    has_next: bool
+
+
+@dataclass
+class ServerFilter:
+    """Фильтр списка серверов; заданные условия объединяются через И."""
+    hosting: Optional[str] = None
+    location: Optional[str] = None
+    tag: Optional[str] = None
+    due_days: Optional[int] = None  # оплата не позже чем через N дней, включая просроченные
+
+    @property
+    def active(self) -> int:
+        return sum(value is not None for value in (self.hosting, self.location, self.tag, self.due_days))
+
+
+@dataclass
+class UserFacets:
+    """Уже использованные значения: подсказки мастера и фильтры списка."""
+    hostings: list[str]
+    locations: list[str]
+    prices: list[tuple[float, str]]  # (price, currency)
+    tags: list[str] = field(default_factory=list)
+
+
+@dataclass
+class SpendAggregate:
+    """Расходы на серверы одного хостинга в одной валюте."""
+    currency: str
+    hosting: str
+    servers: int
+    monthly: float
+    yearly: float
+
+
+@dataclass
+class OutboxMessage:
+    """Исходящее уведомление, сохранённое до отправки.
+
+    Напоминание хранит готовый текст, смена статуса — сервер и статус:
+    текст (отдельный или сводка) собирается при отправке.
+    """
+    chat_id: int
+    kind: str  # reminder, status
+    dedupe_key: str
+    text: Optional[str] = None
+    server_id: Optional[int] = None
+    is_online: Optional[bool] = None
+    id: Optional[int] = None
+    created_at: Optional[datetime] = None
+    attempts: int = 0
+
+
+@dataclass
+class WriteResult:
+    """Результат одной мутации из пачки."""
+    rowcount: int
+    lastrowid: Optional[int]
+
+
+class ConnectionPool:
+    """Пул долгоживущих соединений SQLite: один писатель и N читателей.
+
+    WAL позволяет читателям работать параллельно с писателем,
+    поэтому чтения не ждут записей и наоборот.
+    """
+
+    def __init__(self, db_path: str, readers: int = DB_POOL_READERS):
+        self.db_path = db_path
+        self.size = max(1, readers)
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._writer_lock = asyncio.Lock()
+        self._readers: list[aiosqlite.Connection] = []
+        self._idle: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    async def open(self):
+        """Открывает соединения. Повторный вызов ничего не делает."""
+        if self.is_open:
+            return
+
+        # Писатель открывается первым: он переводит базу в WAL.
+        # Транзакциями писателя управляет WriteQueue, поэтому autocommit
+        self._writer = await self._connect(isolation_level=None)
+        try:
+            await self._writer.execute_fetchall("PRAGMA journal_mode = WAL")
+
+            for _ in range(self.size):
+                conn = await self._connect()
+                self._readers.append(conn)
+                await conn.execute_fetchall("PRAGMA query_only = ON")
+                self._idle.put_nowait(conn)
+        except BaseException:
+            # Потоки соединений не daemon: недооткрытый пул не дал бы процессу завершиться
+            await self.close()
+            raise
+
+        logger.info(f"Database pool opened: 1 writer, {self.size} readers")
+
+    async def close(self):
+        """Закрывает все соединения пула."""
+        for conn in self._readers:
+            await conn.close()
+        self._readers.clear()
+        self._idle = asyncio.Queue()
+
+        if self._writer:
+            await self._writer.close()
+            self._writer = None
+
+        logger.info("Database pool closed")
+
+    async def _connect(self, **kwargs) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.db_path, **kwargs)
+        try:
+            conn.row_factory = aiosqlite.Row
+            await conn.execute_fetchall(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+            # В режиме WAL NORMAL не теряет целостность, но не делает fsync на каждый commit
+            await conn.execute_fetchall("PRAGMA synchronous = NORMAL")
+            await conn.execute_fetchall("PRAGMA temp_store = MEMORY")
+            await conn.execute_fetchall("PRAGMA cache_size = -16000")  # ~16 МБ
+            await conn.execute_fetchall("PRAGMA mmap_size = 134217728")  # 128 МБ
+        except BaseException:
+            await conn.close()
+            raise
+        return conn
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Берёт свободное соединение для чтения."""
+        if not self.is_open:
+            raise RuntimeError("Database pool is not open, call init_db() first")
+        conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put_nowait(conn)
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Эксклюзивный доступ к соединению для записи."""
+        if not self.is_open:
+            raise RuntimeError("Database pool is not open, call init_db() first")
+        async with self._writer_lock:
+            yield self._writer
+
+
+@dataclass
+class UserSummary:
+    """Сводка для главного меню на дату day."""
+    day: date
+    total: int = 0
+    overdue: int = 0
+    urgent: int = 0  # 0–3 дня
+    soon: int = 0  # 4–7 дней
+    monthly_spend: dict[str, float] = field(default_factory=dict)
+    next_expiry: Optional[Server] = None  # ближайшая непросроченная оплата
+
+    @property
+    def attention(self) -> int:
+        """Серверы с оплатой в ближайшие 7 дней и просроченные."""
+        return self.overdue + self.urgent + self.soon
+
+    def add(self, server: Server, sign: int = 1):
+        """Учитывает сервер (sign=1) или убирает его вклад (sign=-1)."""
+        self.total += sign
+        days_left = (server.expiry_date - self.day).days
+        if days_left < 0:
+            self.overdue += sign
+        elif days_left <= 3:
+            self.urgent += sign
+        elif days_left <= 7:
+            self.soon += sign
+
+        spend = self.monthly_spend.get(server.currency, 0.0) + sign * server.price / period_months(server.payment_period)
+        if abs(spend) < 0.005:
+            self.monthly_spend.pop(server.currency, None)
+        else:
+            self.monthly_spend[server.currency] = spend
+
+
+class ExpiryIndex:
+    """Серверы каждого пользователя, отсортированные по дате оплаты.
+
+    Держится в памяти процесса: загружается при старте и обновляется
+    методами Database после каждого коммита, поэтому срочные серверы,
+    напоминания и счётчики меню не обращаются к SQLite. Возвращаемые
+    объекты Server общие с индексом — изменять их нельзя.
+    """
+
+    def __init__(self):
+        # user_id -> отсортированный список (ordinal даты оплаты, server_id)
+        self._keys: dict[int, list[tuple[int, int]]] = {}
+        self._servers: dict[int, Server] = {}
+        # Сводки меню: правятся на каждом изменении, пересчитываются со сменой дня
+        self._summaries: dict[int, UserSummary] = {}
+
+    def load(self, servers: list[Server]):
+        self._keys.clear()
+        self._servers.clear()
+        self._summaries.clear()
+        for server in servers:
+            self._servers[server.id] = server
+            self._keys.setdefault(server.user_id, []).append((server.expiry_date.toordinal(), server.id))
+        for keys in self._keys.values():
+            keys.sort()
+
+    def put(self, server: Server):
+        """Добавляет сервер или заменяет его прежнюю версию, O(n) на пользователя."""
+        self.remove(server.id)
+        self._servers[server.id] = server
+        bisect.insort(self._keys.setdefault(server.user_id, []), (server.expiry_date.toordinal(), server.id))
+        summary = self._summaries.get(server.user_id)
+        if summary:
+            summary.add(server)
+
+    def remove(self, server_id: int):
+        server = self._servers.pop(server_id, None)
+        if server is None:
+            return
+        summary = self._summaries.get(server.user_id)
+        if summary:
+            summary.add(server, -1)
+        keys = self._keys[server.user_id]
+        key = (server.expiry_date.toordinal(), server.id)
+        i = bisect.bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            del keys[i]
+        if not keys:
+            del self._keys[server.user_id]
+
+    def replace_user(self, user_id: int, servers: list[Server]):
+        """Заменяет все серверы пользователя свежими из базы."""
+        for _, server_id in self._keys.get(user_id, []).copy():
+            self.remove(server_id)
+        for server in servers:
+            self.put(server)
+
+    def summary(self, user_id: int) -> UserSummary:
+        """Сводка пользователя; с наступлением нового дня пересчитывается, O(n)."""
+        today = date.today()
+        summary = self._summaries.get(user_id)
+        if summary is None or summary.day != today:
+            summary = UserSummary(day=today)
+            for _, server_id in self._keys.get(user_id, []):
+                summary.add(self._servers[server_id])
+            self._summaries[user_id] = summary
+
+        keys = self._keys.get(user_id, [])
+        i = bisect.bisect_left(keys, (today.toordinal(), 0))
+        summary.next_expiry = self._servers[keys[i][1]] if i < len(keys) else None
+        return summary
+
+    def between(self, user_id: int, first: Optional[date], last: date) -> list[Server]:
+        """Серверы с оплатой в [first, last] по возрастанию даты; first=None — с самых ранних."""
+        keys = self._keys.get(user_id, [])
+        lo = bisect.bisect_left(keys, (first.toordinal(), 0)) if first else 0
+        hi = bisect.bisect_right(keys, (last.toordinal(), float('inf')))
+        return [self._servers[server_id] for _, server_id in keys[lo:hi]]
+
+
+@dataclass
+class _CachedUser:
+    servers: dict[int, Server] = field(default_factory=dict)
+    ordered: Optional[list[Server]] = None  # полный список, если он читался
+
+
+# Сервера нет в кэше — нужно читать из базы
+_MISS = object()
+
+
+class ServerCache:
+    """Read-through кэш серверов, разложенный по пользователям.
+
+    У каждого пользователя есть версия данных, которая растёт при любом
+    изменении его серверов. Прочитанное из базы кладётся в кэш, только если
+    версия за время чтения не изменилась, поэтому запрос, заставший запись,
+    не вернёт в кэш старые данные. Когда в кэше больше max_servers серверов,
+    вытесняются давно не читавшиеся пользователи. Объекты Server общие
+    для всех читателей — изменять их нельзя.
+    """
+
+    def __init__(self, max_servers: int = DB_SERVER_CACHE_MAX):
+        self.max_servers = max_servers
+        self._versions: dict[int, int] = {}
+        self._users: OrderedDict[int, _CachedUser] = OrderedDict()
+        self._size = 0
+
+    def version(self, user_id: int) -> int:
+        return self._versions.get(user_id, 0)
+
+    def invalidate(self, user_id: int):
+        self._versions[user_id] = self.version(user_id) + 1
+        self._drop(user_id)
+
+    def clear(self):
+        self._users.clear()
+        self._size = 0
+
+    def get_server(self, user_id: int, server_id: int):
+        """Сервер, None, если его точно нет, или _MISS."""
+        entry = self._touch(user_id)
+        if entry is None:
+            return _MISS
+        server = entry.servers.get(server_id)
+        if server is None and entry.ordered is None:
+            return _MISS
+        return server
+
+    def get_all(self, user_id: int) -> Optional[list[Server]]:
+        entry = self._touch(user_id)
+        if entry is None or entry.ordered is None:
+            return None
+        return list(entry.ordered)
+
+    def put_server(self, user_id: int, version: int, server: Server):
+        if version != self.version(user_id):
+            return
+        entry = self._users.get(user_id)
+        if entry is None:
+            entry = self._users[user_id] = _CachedUser()
+        if server.id not in entry.servers:
+            self._size += 1
+        entry.servers[server.id] = server
+        self._evict(user_id)
+
+    def put_all(self, user_id: int, version: int, servers: list[Server]):
+        if version != self.version(user_id) or len(servers) > self.max_servers:
+            return
+        self._drop(user_id)
+        self._users[user_id] = _CachedUser(
+            servers={server.id: server for server in servers},
+            ordered=servers
+        )
+        self._size += len(servers)
+        self._evict(user_id)
+
+    def _touch(self, user_id: int) -> Optional[_CachedUser]:
+        entry = self._users.get(user_id)
+        if entry is not None:
+            self._users.move_to_end(user_id)
+        return entry
+
+    def _drop(self, user_id: int):
+        entry = self._users.pop(user_id, None)
+        if entry is not None:
+            self._size -= len(entry.servers)
+
+    def _evict(self, keep_user_id: int):
+        self._users.move_to_end(keep_user_id)
+        while self._size > self.max_servers and len(self._users) > 1:
+            _, entry = self._users.popitem(last=False)
+            self._size -= len(entry.servers)
+
+
+WriteOp = Callable[[aiosqlite.Connection], Awaitable[Any]]
+
+
+class WriteQueue:
+    """Единственный писатель: копит мутации и коммитит их пачками.
+
+    Мутации, пришедшие в пределах окна DB_WRITE_BATCH_WINDOW_MS, выполняются
+    в одной транзакции (один fsync на пачку). Каждая мутация обёрнута в
+    SAVEPOINT, поэтому ошибка одной не откатывает соседей, а вызывающий
+    получает свой собственный результат или исключение.
+    """
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        window_ms: int = DB_WRITE_BATCH_WINDOW_MS,
+        max_batch: int = DB_WRITE_BATCH_MAX
+    ):
+        self.pool = pool
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self._queue: asyncio.Queue[Optional[tuple[WriteOp, asyncio.Future]]] = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.batches = 0
+        self.writes = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.max_depth = 0
+
+    @property
+    def depth(self) -> int:
+        """Количество мутаций, ожидающих записи."""
+        return self._queue.qsize()
+
+    def stats(self) -> dict[str, float]:
+        """Метрики очереди записи."""
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "batches": self.batches,
+            "writes": self.writes,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "avg_batch_size": self.writes / self.batches if self.batches else 0.0,
+        }
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Дописывает всё, что уже в очереди, и останавливает писателя."""
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+        logger.info(f"Write queue stopped: {self.stats()}")
+
+    async def submit(self, op: WriteOp) -> Any:
+        """Ставит мутацию в очередь и ждёт её коммита.
+
+        op получает соединение писателя и выполняется внутри транзакции пачки.
+        """
+        if self._task is None:
+            raise RuntimeError("Write queue is not running, call init_db() first")
+        if self._task.done():
+            raise RuntimeError("Write queue writer has stopped")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((op, future))
+        self.max_depth = max(self.max_depth, self.depth)
+        return await future
+
+    async def execute(self, sql: str, parameters: Sequence[Any] = ()) -> WriteResult:
+        async def op(conn: aiosqlite.Connection) -> WriteResult:
+            cursor = await conn.execute(sql, parameters)
+            return WriteResult(cursor.rowcount, cursor.lastrowid)
+        return await self.submit(op)
+
+    async def executemany(self, sql: str, parameters: Sequence[Sequence[Any]]) -> WriteResult:
+        async def op(conn: aiosqlite.Connection) -> WriteResult:
+            cursor = await conn.executemany(sql, parameters)
+            return WriteResult(cursor.rowcount, cursor.lastrowid)
+        return await self.submit(op)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+
+            # Добираем всё, что придёт в пределах окна
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            # Писатель не должен падать: иначе все следующие submit() повиснут
+            try:
+                await self._commit(batch)
+            except Exception as e:
+                logger.error(f"Write batch of {len(batch)} could not be committed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def _commit(self, batch: list[tuple[WriteOp, asyncio.Future]]):
+        results: list[tuple[asyncio.Future, Any, Optional[BaseException]]] = []
+
+        async with self.pool.writer() as conn:
+            try:
+                await conn.execute("BEGIN IMMEDIATE")
+                for op, future in batch:
+                    await conn.execute("SAVEPOINT write_op")
+                    try:
+                        result = await op(conn)
+                    except Exception as e:
+                        await conn.execute("ROLLBACK TO write_op")
+                        await conn.execute("RELEASE write_op")
+                        results.append((future, None, e))
+                    else:
+                        await conn.execute("RELEASE write_op")
+                        results.append((future, result, None))
+                await conn.execute("COMMIT")
+            except Exception as e:
+                logger.error(f"Write batch of {len(batch)} failed: {e}")
+                if conn.in_transaction:
+                    await conn.execute("ROLLBACK")
+                results = [(future, None, e) for _, future in batch]
+
+        self.batches += 1
+        self.writes += len(batch)
+        self.last_batch_size = len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+        if len(batch) > 1:
+            logger.debug(f"Committed write batch of {len(batch)}, queue depth {self.depth}")
+
+        for future, result, error in results:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
 async def init_db():
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS servers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                hosting TEXT NOT NULL,
-                location TEXT,
-                ip TEXT,
-                url TEXT,
-                expiry_date DATE NOT NULL,
-                price REAL NOT NULL,
-                currency TEXT NOT NULL DEFAULT 'RUB',
-                payment_period TEXT NOT NULL DEFAULT 'monthly',
-                notes TEXT,
-                tags TEXT,
-                is_monitoring BOOLEAN DEFAULT 0,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+    await db.open()
+    try:
+        async with db.pool.writer() as db_conn:
+            await _create_schema(db_conn)
 
-        # Миграция: добавляем location если колонка не существует
-        cursor = await db.execute("PRAGMA table_info(servers)")
-        columns = [row[1] for row in await cursor.fetchall()]
-        if 'location' not in columns:
-            await db.execute("ALTER TABLE servers ADD COLUMN location TEXT")
+        await db.load_expiry_index()
+        await db.load_reminder_timezones()
+    except BaseException:
+        # Иначе соединения пула держат процесс после ошибки миграции
+        await db.close()
+        raise
 
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS settings (
-                user_id INTEGER PRIMARY KEY,
-                reminder_days INTEGER DEFAULT 7,
-                reminder_time TEXT DEFAULT '10:00'
-            )
-        """)
 
-        await db.execute("""
-            CREATE INDEX IF NOT EXISTS idx_servers_user_id ON servers(user_id)
-        """)
+async def close_db():
+    await db.close()
 
-        await db.execute("""
-            CREATE INDEX IF NOT EXISTS idx_servers_expiry ON servers(expiry_date)
-        """)
 
-        # Таблица API ключей хостингов
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS api_keys (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                provider TEXT NOT NULL,
-                api_key TEXT NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(user_id, provider)
+async def _create_schema(db: aiosqlite.Connection):
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS servers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            hosting TEXT NOT NULL,
+            location TEXT,
+            ip TEXT,
+            url TEXT,
+            expiry_date DATE NOT NULL,
+            price REAL NOT NULL,
+            currency TEXT NOT NULL DEFAULT 'RUB',
+            payment_period TEXT NOT NULL DEFAULT 'monthly',
+            notes TEXT,
+            tags TEXT,
+            is_monitoring BOOLEAN DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Миграция: добавляем location если колонка не существует
+    cursor = await db.execute("PRAGMA table_info(servers)")
+    columns = [row[1] for row in await cursor.fetchall()]
+    if 'location' not in columns:
+        await db.execute("ALTER TABLE servers ADD COLUMN location TEXT")
+
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS settings (
+            user_id INTEGER PRIMARY KEY,
+            reminder_days INTEGER DEFAULT 7,
+            reminder_time TEXT DEFAULT '10:00'
+        )
+    """)
+
+    cursor = await db.execute("PRAGMA table_info(settings)")
+    columns = [row[1] for row in await cursor.fetchall()]
+    if 'timezone' not in columns:
+        await db.execute("ALTER TABLE settings ADD COLUMN timezone TEXT")
+
+    # У каждого пользователя с серверами есть строка настроек без NULL,
+    # чтобы выборка напоминаний шла по индексу без COALESCE
+    await db.execute(
+        "INSERT OR IGNORE INTO settings (user_id) SELECT DISTINCT user_id FROM servers"
+    )
+    await db.execute(
+        """
+        UPDATE settings SET
+            reminder_days = COALESCE(reminder_days, ?),
+            reminder_time = COALESCE(reminder_time, ?),
+            timezone = COALESCE(timezone, ?)
+        WHERE reminder_days IS NULL OR reminder_time IS NULL OR timezone IS NULL
+        """,
+        (DEFAULT_REMINDER_DAYS, DEFAULT_REMINDER_TIME, DEFAULT_TIMEZONE)
+    )
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_settings_reminder ON settings(timezone, reminder_time)
+    """)
+
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_servers_user_id ON servers(user_id)
+    """)
+
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_servers_expiry ON servers(expiry_date)
+    """)
+
+    # Постраничный список по дате оплаты читается по курсору без сортировки
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_servers_user_expiry ON servers(user_id, expiry_date)
+    """)
+
+    # Постраничный список по хостингу и локации (по дате — idx_servers_user_expiry)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_servers_user_hosting
+        ON servers(user_id, hosting COLLATE NOCASE, expiry_date)
+    """)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_servers_user_location
+        ON servers(user_id, location COLLATE NOCASE, expiry_date)
+    """)
+
+    # Статистика расходов считается по индексу, не читая таблицу серверов
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_servers_user_spend
+        ON servers(user_id, currency, payment_period, hosting, price)
+    """)
+
+    # Таблица API ключей хостингов
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS api_keys (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            provider TEXT NOT NULL,
+            api_key TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, provider)
+        )
+    """)
+
+    # Добавляем external_id для связи с хостингом
+    cursor = await db.execute("PRAGMA table_info(servers)")
+    columns = [row[1] for row in await cursor.fetchall()]
+    if 'external_id' not in columns:
+        await db.execute("ALTER TABLE servers ADD COLUMN external_id TEXT")
+    if 'provider' not in columns:
+        await db.execute("ALTER TABLE servers ADD COLUMN provider TEXT")
+    if 'monitoring_ports' not in columns:
+        await db.execute("ALTER TABLE servers ADD COLUMN monitoring_ports TEXT")
+
+    # Мониторинг: последний статус каждого сервера и сырые результаты проверок
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS monitor_state (
+            server_id INTEGER PRIMARY KEY,
+            is_online BOOLEAN NOT NULL,
+            changed_at DATETIME NOT NULL,
+            checked_at DATETIME NOT NULL,
+            last_port INTEGER
+        )
+    """)
+
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS monitor_checks (
+            id INTEGER PRIMARY KEY,
+            server_id INTEGER NOT NULL,
+            checked_at DATETIME NOT NULL,
+            is_online BOOLEAN NOT NULL,
+            latency_ms REAL,
+            port INTEGER,
+            http_status INTEGER
+        )
+    """)
+
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_monitor_checks_server ON monitor_checks(server_id, checked_at)
+    """)
+
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_monitor_checks_time ON monitor_checks(checked_at)
+    """)
+
+    # Часовые и суточные агрегаты мониторинга
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS monitor_rollups (
+            server_id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            bucket_start DATETIME NOT NULL,
+            checks INTEGER NOT NULL,
+            up INTEGER NOT NULL,
+            min_ms REAL,
+            avg_ms REAL,
+            p95_ms REAL,
+            PRIMARY KEY (server_id, period, bucket_start)
+        ) WITHOUT ROWID
+    """)
+
+    # Теги серверов по одному в строке — для фильтра списка по индексу.
+    # Колонка servers.tags остаётся источником, таблица пересобирается при записи
+    cursor = await db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'server_tags'"
+    )
+    has_server_tags = await cursor.fetchone() is not None
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS server_tags (
+            user_id INTEGER NOT NULL,
+            tag TEXT NOT NULL,
+            server_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, tag, server_id)
+        ) WITHOUT ROWID
+    """)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_server_tags_server ON server_tags(server_id)
+    """)
+    if not has_server_tags:
+        cursor = await db.execute("SELECT id, user_id, tags FROM servers WHERE tags IS NOT NULL")
+        await db.executemany(
+            "INSERT OR IGNORE INTO server_tags (user_id, tag, server_id) VALUES (?, ?, ?)",
+            [(row[1], tag, row[0]) for row in await cursor.fetchall() for tag in split_tags(row[2])]
+        )
+
+    # Очередь уведомлений: пишется вместе с изменением, которое её вызвало,
+    # и отправляется фоновой задачей. dedupe_key не даёт поставить одно
+    # уведомление дважды (например, напоминание за тот же день после рестарта)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY,
+            chat_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            dedupe_key TEXT NOT NULL UNIQUE,
+            text TEXT,
+            server_id INTEGER,
+            is_online BOOLEAN,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            sent_at DATETIME
+        )
+    """)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox(id) WHERE status = 'pending'
+    """)
+
+    # Один сервер хостинга — одна строка. Дубликаты, если успели появиться
+    # до индекса, схлопываем в самую раннюю запись вместе с их тегами
+    # и историей мониторинга
+    cursor = await db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_servers_external'"
+    )
+    if not await cursor.fetchone():
+        rows = await db.execute_fetchall("""
+            DELETE FROM servers
+            WHERE external_id IS NOT NULL AND id NOT IN (
+                SELECT MIN(id) FROM servers
+                WHERE external_id IS NOT NULL
+                GROUP BY user_id, provider, external_id
             )
+            RETURNING id, user_id
+        """)
+        if rows:
+            for table in ("monitor_state", "monitor_checks", "monitor_rollups", "server_tags"):
+                await db.executemany(
+                    f"DELETE FROM {table} WHERE server_id = ?", [(row[0],) for row in rows]
+                )
+            logger.warning(
+                f"Collapsed {len(rows)} duplicate hosting servers of "
+                f"{len({row[1] for row in rows})} users: ids {sorted(row[0] for row in rows)}"
+            )
+        await db.execute("""
+            CREATE UNIQUE INDEX idx_servers_external
+            ON servers(user_id, provider, external_id)
         """)
 
-        # Добавляем external_id для связи с хостингом
-        cursor = await db.execute("PRAGMA table_info(servers)")
-        columns = [row[1] for row in await cursor.fetchall()]
-        if 'external_id' not in columns:
-            await db.execute("ALTER TABLE servers ADD COLUMN external_id TEXT")
-        if 'provider' not in columns:
-            await db.execute("ALTER TABLE servers ADD COLUMN provider TEXT")
-
-        await db.commit()
+    await db.commit()
 
 
 class Database:
     def __init__(self, db_path: str = DATABASE_PATH):
         self.db_path = db_path
+        self.pool = ConnectionPool(db_path)
+        self.writes = WriteQueue(self.pool)
+        self.expiry = ExpiryIndex()
+        self.cache = ServerCache()
+        # LRU-кэш подсказок мастера, сбрасывается при изменении серверов
+        self._facets: OrderedDict[int, UserFacets] = OrderedDict()
+        # Часовые пояса из настроек: планировщик обходит их каждую минуту
+        self._timezones: set[str] = {DEFAULT_TIMEZONE}
+
+    async def open(self):
+        """Открывает пул соединений и запускает писателя."""
+        await self.pool.open()
+        self.writes.start()
+
+    async def close(self):
+        """Дописывает очередь и закрывает пул соединений."""
+        await self.writes.stop()
+        await self.pool.close()
+
+    async def load_expiry_index(self):
+        """Загружает индекс дат оплаты из базы."""
+        async with self.pool.reader() as db:
+            cursor = await db.execute("SELECT * FROM servers")
+            cursor.arraysize = 500
+            servers = [self._row_to_server(row) async for row in cursor]
+        self.expiry.load(servers)
+        logger.info(f"Expiry index loaded: {len(servers)} servers")
+
+    async def load_reminder_timezones(self):
+        """Загружает часовые пояса напоминаний из настроек."""
+        async with self.pool.reader() as db:
+            rows = await db.execute_fetchall("SELECT DISTINCT timezone FROM settings")
+        self._timezones = {DEFAULT_TIMEZONE} | {row[0] for row in rows if row[0]}
+
+    def _servers_changed(self, user_id: int):
+        """Сбрасывает кэши, зависящие от серверов пользователя."""
+        self.cache.invalidate(user_id)
+        self._facets.pop(user_id, None)
 
     async def get_server_count(self, user_id: int) -> int:
         """Возвращает количество серверов пользователя."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.reader() as db:
             cursor = await db.execute(
                 "SELECT COUNT(*) FROM servers WHERE user_id = ?",
                 (user_id,)
@@ -138,78 +950,194 @@ class Database:
         notes: Optional[str] = None,
         tags: Optional[str] = None
     ) -> int:
-        # Проверка лимита серверов
-        count = await self.get_server_count(user_id)
-        if count >= MAX_SERVERS_PER_USER:
-            raise ValueError(f"Превышен лимит серверов ({MAX_SERVERS_PER_USER})")
-
-        async with aiosqlite.connect(self.db_path) as db:
+        async def op(db: aiosqlite.Connection) -> Server:
+            # Проверка лимита серверов — в той же транзакции, что и вставка
             cursor = await db.execute(
+                "SELECT COUNT(*) FROM servers WHERE user_id = ?",
+                (user_id,)
+            )
+            count = (await cursor.fetchone())[0]
+            if count >= MAX_SERVERS_PER_USER:
+                raise ValueError(f"Превышен лимит серверов ({MAX_SERVERS_PER_USER})")
+
+            rows = await db.execute_fetchall(
                 """
                 INSERT INTO servers (user_id, name, hosting, location, ip, url, expiry_date,
                                      price, currency, payment_period, notes, tags)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                RETURNING *
                 """,
                 (user_id, name, hosting, location, ip, url, expiry_date.isoformat(),
                  price, currency, payment_period, notes, tags)
             )
-            await db.commit()
-            return cursor.lastrowid
+            server = self._row_to_server(rows[0])
+            await _sync_server_tags(db, [server])
+            await _ensure_settings(db, user_id)
+            return server
+
+        server = await self.writes.submit(op)
+        self.expiry.put(server)
+        self._servers_changed(user_id)
+        return server.id
 
     async def get_server(self, server_id: int, user_id: int) -> Optional[Server]:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        """Сервер пользователя; повторные чтения отдаются из кэша."""
+        server = self.cache.get_server(user_id, server_id)
+        if server is not _MISS:
+            return server
+
+        version = self.cache.version(user_id)
+        async with self.pool.reader() as db:
             cursor = await db.execute(
                 "SELECT * FROM servers WHERE id = ? AND user_id = ?",
                 (server_id, user_id)
             )
             row = await cursor.fetchone()
-            if row:
-                return self._row_to_server(row)
+        if row is None:
             return None
+        server = self._row_to_server(row)
+        self.cache.put_server(user_id, version, server)
+        return server
 
     async def get_all_servers(self, user_id: int) -> list[Server]:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        """Все серверы пользователя по дате оплаты; повторные чтения — из кэша."""
+        servers = self.cache.get_all(user_id)
+        if servers is not None:
+            return servers
+
+        version = self.cache.version(user_id)
+        async with self.pool.reader() as db:
             cursor = await db.execute(
                 "SELECT * FROM servers WHERE user_id = ? ORDER BY expiry_date",
                 (user_id,)
             )
             rows = await cursor.fetchall()
-            return [self._row_to_server(row) for row in rows]
+        servers = [self._row_to_server(row) for row in rows]
+        self.cache.put_all(user_id, version, servers)
+        return list(servers)
 
-    async def get_expiring_servers(self, user_id: int, days: int = 30) -> list[Server]:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+    async def get_servers_by_ids(self, server_ids: Sequence[int]) -> dict[int, Server]:
+        """Серверы по списку id; удалённые в результат не попадают."""
+        if not server_ids:
+            return {}
+        async with self.pool.reader() as db:
+            placeholders = ",".join("?" * len(server_ids))
             cursor = await db.execute(
-                """
-                SELECT * FROM servers
-                WHERE user_id = ? AND expiry_date <= date('now', '+' || ? || ' days')
-                ORDER BY expiry_date
-                """,
-                (user_id, days)
+                f"SELECT * FROM servers WHERE id IN ({placeholders})",
+                list(server_ids)
             )
             rows = await cursor.fetchall()
-            return [self._row_to_server(row) for row in rows]
+            return {row['id']: self._row_to_server(row) for row in rows}
 
-    async def get_servers_for_reminder(self, days: int) -> list[Server]:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute(
+    async def list_servers_page(
+        self,
+        user_id: int,
+        sort: str = "date",
+        after: Optional[int] = None,
+        before: Optional[int] = None,
+        limit: int = LIST_PAGE_SIZE,
+        filters: Optional[ServerFilter] = None
+    ) -> ServerPage:
+        """Страница списка серверов по курсору (keyset), O(limit) при любом числе серверов.
+
+        after — id последнего сервера предыдущей страницы, before — id первого
+        сервера следующей; без курсора или с курсором на удалённый сервер —
+        первая страница, а если за курсором вперёд ничего не осталось — последняя.
+        filters отбирает строки в самом запросе.
+        """
+        segments = _LIST_ORDERS.get(sort, _LIST_ORDERS["date"])
+        filter_sql, filter_params = _filter_sql(user_id, filters)
+        backward = before is not None
+        anchor_id = before if backward else after
+
+        async with self.pool.reader() as db:
+            anchor, start = None, 0
+            if anchor_id is not None:
+                flags = ", ".join(f"{cond} AS segment_{i}" for i, (cond, _) in enumerate(segments))
+                rows = await db.execute_fetchall(
+                    f"SELECT {flags}, * FROM servers WHERE id = ? AND user_id = ?",
+                    (anchor_id, user_id)
+                )
+                if rows:
+                    anchor = rows[0]
+                    start = next(i for i in range(len(segments)) if anchor[f"segment_{i}"])
+            if anchor is None:
+                backward = False
+
+            rows = await _read_list_rows(
+                db, user_id, segments, start, anchor, backward, filter_sql, filter_params, limit
+            )
+            if not rows and anchor is not None and not backward:
+                # За курсором ничего не осталось (серверы страницы оплачены,
+                # удалены или ушли из-под фильтра) — отдаём последнюю страницу
+                rows = await _read_list_rows(
+                    db, user_id, segments, len(segments) - 1, None, True,
+                    filter_sql, filter_params, limit
+                )
+                servers = [self._row_to_server(row) for row in rows[:limit]]
+                servers.reverse()
+                return ServerPage(servers, has_prev=len(rows) > limit, has_next=False)
+
+        more = len(rows) > limit
+        servers = [self._row_to_server(row) for row in rows[:limit]]
+        if not backward:
+            return ServerPage(servers, has_prev=anchor is not None, has_next=more)
+        if not more:
+            # Назад до самого начала — отдаём полную первую страницу
+            return await self.list_servers_page(user_id, sort, limit=limit, filters=filters)
+        servers.reverse()
+        return ServerPage(servers, has_prev=True, has_next=True)
+
+    async def get_filtered_server_ids(self, user_id: int, filters: Optional[ServerFilter] = None) -> list[int]:
+        """id всех серверов пользователя, подходящих под фильтр."""
+        filter_sql, filter_params = _filter_sql(user_id, filters)
+        async with self.pool.reader() as db:
+            rows = await db.execute_fetchall(
+                f"SELECT id FROM servers WHERE user_id = ?{filter_sql} ORDER BY id",
+                (user_id, *filter_params)
+            )
+        return [row[0] for row in rows]
+
+    async def get_expiring_servers(self, user_id: int, days: int = 30) -> list[Server]:
+        """Серверы с оплатой в ближайшие days дней и просроченные, из индекса."""
+        return self.expiry.between(user_id, None, date.today() + timedelta(days=days))
+
+    def get_reminder_timezones(self) -> list[str]:
+        """Часовые пояса, в которых есть пользователи."""
+        return sorted(self._timezones)
+
+    async def iter_reminder_batches(
+        self,
+        timezone: str,
+        after: str,
+        until: str,
+        today: date
+    ) -> AsyncIterator[tuple[int, list[Server]]]:
+        """Серверы для напоминаний, сгруппированные по пользователю.
+
+        Берутся пользователи часового пояса timezone, чьё reminder_time ("ЧЧ:ММ")
+        попадает в интервал (after, until]; today — местная дата этого пояса.
+        Настройки читаются по индексу idx_settings_reminder, серверы в окне
+        reminder_days берутся из индекса дат оплаты.
+        """
+        async with self.pool.reader() as db:
+            users = await db.execute_fetchall(
                 """
-                SELECT * FROM servers
-                WHERE expiry_date <= date('now', '+' || ? || ' days')
-                  AND expiry_date >= date('now')
-                ORDER BY user_id, expiry_date
+                SELECT user_id, reminder_days FROM settings
+                WHERE timezone = ? AND reminder_time > ? AND reminder_time <= ?
                 """,
-                (days,)
+                (timezone, after, until)
             )
-            rows = await cursor.fetchall()
-            return [self._row_to_server(row) for row in rows]
+
+        for row in users:
+            servers = self.expiry.between(
+                row['user_id'], today, today + timedelta(days=row['reminder_days'])
+            )
+            if servers:
+                yield row['user_id'], servers
 
     async def get_servers_for_monitoring(self) -> list[Server]:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.pool.reader() as db:
             cursor = await db.execute(
                 """
                 SELECT * FROM servers
@@ -220,73 +1148,177 @@ class Database:
             return [self._row_to_server(row) for row in rows]
 
     async def update_server(self, server_id: int, user_id: int, **kwargs) -> bool:
-        if not kwargs:
+        updates = _server_updates(kwargs)
+        if not updates:
             return False
 
-        allowed_fields = {
-            'name', 'hosting', 'location', 'ip', 'url', 'expiry_date', 'price',
-            'currency', 'payment_period', 'notes', 'tags', 'is_monitoring'
-        }
+        set_clause = ", ".join(f"{k} = ?" for k in updates.keys())
+        values = list(updates.values()) + [server_id, user_id]
 
-        updates = {k: v for k, v in kwargs.items() if k in allowed_fields}
-        if not updates:
+        async def op(db: aiosqlite.Connection) -> Optional[Server]:
+            rows = await db.execute_fetchall(
+                f"UPDATE servers SET {set_clause} WHERE id = ? AND user_id = ? RETURNING *",
+                values
+            )
+            if not rows:
+                return None
+            server = self._row_to_server(rows[0])
+            if 'tags' in updates:
+                await _sync_server_tags(db, [server])
+            return server
+
+        server = await self.writes.submit(op)
+        if server is None:
             return False
+        self.expiry.put(server)
+        self._servers_changed(user_id)
+        return True
 
-        if 'expiry_date' in updates and isinstance(updates['expiry_date'], date):
-            updates['expiry_date'] = updates['expiry_date'].isoformat()
+    async def update_servers(self, server_ids: Sequence[int], user_id: int, **kwargs) -> list[Server]:
+        """Меняет поля сразу у нескольких серверов одной транзакцией.
+
+        Возвращает обновлённые серверы; чужие и удалённые id пропускаются.
+        """
+        updates = _server_updates(kwargs)
+        if not updates or not server_ids:
+            return []
 
         set_clause = ", ".join(f"{k} = ?" for k in updates.keys())
-        values = list(updates.values()) + [server_id, user_id]
+        placeholders = ", ".join("?" * len(server_ids))
+        values = list(updates.values()) + [user_id, *server_ids]
 
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                f"UPDATE servers SET {set_clause} WHERE id = ? AND user_id = ?",
+        async def op(db: aiosqlite.Connection) -> list[Server]:
+            rows = await db.execute_fetchall(
+                f"UPDATE servers SET {set_clause} WHERE user_id = ? AND id IN ({placeholders}) RETURNING *",
                 values
             )
-            await db.commit()
-            return cursor.rowcount > 0
+            servers = [self._row_to_server(row) for row in rows]
+            if 'tags' in updates:
+                await _sync_server_tags(db, servers)
+            return servers
+
+        servers = await self.writes.submit(op)
+        for server in servers:
+            self.expiry.put(server)
+        if servers:
+            self._servers_changed(user_id)
+        return servers
 
     async def delete_server(self, server_id: int, user_id: int) -> bool:
-        async with aiosqlite.connect(self.db_path) as db:
+        async def op(db: aiosqlite.Connection) -> bool:
             cursor = await db.execute(
                 "DELETE FROM servers WHERE id = ? AND user_id = ?",
                 (server_id, user_id)
             )
-            await db.commit()
-            return cursor.rowcount > 0
+            if cursor.rowcount == 0:
+                return False
+            await db.execute("DELETE FROM monitor_state WHERE server_id = ?", (server_id,))
+            await db.execute("DELETE FROM monitor_checks WHERE server_id = ?", (server_id,))
+            await db.execute("DELETE FROM monitor_rollups WHERE server_id = ?", (server_id,))
+            await db.execute("DELETE FROM server_tags WHERE server_id = ?", (server_id,))
+            return True
 
-    async def mark_paid(self, server_id: int, user_id: int) -> Optional[date]:
-        server = await self.get_server(server_id, user_id)
-        if not server:
-            return None
+        deleted = await self.writes.submit(op)
+        if deleted:
+            self.expiry.remove(server_id)
+            self._servers_changed(user_id)
+        return deleted
 
-        from dateutil.relativedelta import relativedelta
-
-        period = server.payment_period
-        if period == "monthly":
-            new_date = server.expiry_date + relativedelta(months=1)
-        elif period == "quarterly":
-            new_date = server.expiry_date + relativedelta(months=3)
-        elif period == "halfyear":
-            new_date = server.expiry_date + relativedelta(months=6)
-        elif period == "yearly":
-            new_date = server.expiry_date + relativedelta(years=1)
-        elif period.startswith("custom_"):
-            # Формат: custom_N где N - количество месяцев
-            try:
-                months = int(period.split("_")[1])
-                new_date = server.expiry_date + relativedelta(months=months)
-            except (IndexError, ValueError):
-                new_date = server.expiry_date + relativedelta(months=1)
-        else:
-            new_date = server.expiry_date + relativedelta(months=1)
+    async def delete_servers(self, server_ids: Sequence[int], user_id: int) -> list[int]:
+        """Удаляет несколько серверов с историей мониторинга одной транзакцией.
 
-        await self.update_server(server_id, user_id, expiry_date=new_date)
-        return new_date
+        Возвращает id действительно удалённых серверов.
+        """
+        if not server_ids:
+            return []
+        placeholders = ", ".join("?" * len(server_ids))
+
+        async def op(db: aiosqlite.Connection) -> list[int]:
+            rows = await db.execute_fetchall(
+                f"DELETE FROM servers WHERE user_id = ? AND id IN ({placeholders}) RETURNING id",
+                (user_id, *server_ids)
+            )
+            deleted = [row[0] for row in rows]
+            if deleted:
+                in_deleted = ", ".join("?" * len(deleted))
+                for table in ("monitor_state", "monitor_checks", "monitor_rollups", "server_tags"):
+                    await db.execute(f"DELETE FROM {table} WHERE server_id IN ({in_deleted})", deleted)
+            return deleted
+
+        deleted = await self.writes.submit(op)
+        for server_id in deleted:
+            self.expiry.remove(server_id)
+        if deleted:
+            self._servers_changed(user_id)
+        return deleted
+
+    async def mark_paid(
+        self,
+        server_id: int,
+        user_id: int,
+        price: Optional[float] = None,
+        currency: Optional[str] = None,
+        payment_period: Optional[str] = None
+    ) -> Optional[Server]:
+        """Отмечает оплату одним UPDATE: применяет новые условия, если заданы,
+        и сдвигает дату оплаты на период (уже новый).
+
+        Дата сдвигается как relativedelta: 31.01 + месяц = 28.02 (29.02).
+        Возвращает обновлённый сервер или None, если его нет.
+        """
+        next_expiry = _advance_expiry_sql(_period_months_sql("COALESCE(:period, payment_period)"))
+
+        async def op(db: aiosqlite.Connection) -> Optional[Server]:
+            rows = await db.execute_fetchall(
+                f"""
+                UPDATE servers SET
+                    price = COALESCE(:price, price),
+                    currency = COALESCE(:currency, currency),
+                    payment_period = COALESCE(:period, payment_period),
+                    expiry_date = {next_expiry}
+                WHERE id = :id AND user_id = :user_id
+                RETURNING *
+                """,
+                {
+                    "price": price, "currency": currency, "period": payment_period,
+                    "id": server_id, "user_id": user_id
+                }
+            )
+            return self._row_to_server(rows[0]) if rows else None
+
+        server = await self.writes.submit(op)
+        if server is not None:
+            self.expiry.put(server)
+            self._servers_changed(user_id)
+        return server
+
+    async def mark_paid_many(self, server_ids: Sequence[int], user_id: int) -> list[Server]:
+        """Отмечает оплату нескольких серверов на прежних условиях одной транзакцией."""
+        if not server_ids:
+            return []
+        next_expiry = _advance_expiry_sql(_period_months_sql("payment_period"))
+        placeholders = ", ".join("?" * len(server_ids))
+
+        async def op(db: aiosqlite.Connection) -> list[Server]:
+            rows = await db.execute_fetchall(
+                f"""
+                UPDATE servers SET expiry_date = {next_expiry}
+                WHERE user_id = ? AND id IN ({placeholders})
+                RETURNING *
+                """,
+                (user_id, *server_ids)
+            )
+            return [self._row_to_server(row) for row in rows]
+
+        servers = await self.writes.submit(op)
+        for server in servers:
+            self.expiry.put(server)
+        if servers:
+            self._servers_changed(user_id)
+        return servers
 
     async def get_settings(self, user_id: int) -> UserSettings:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.pool.reader() as db:
             cursor = await db.execute(
                 "SELECT * FROM settings WHERE user_id = ?",
                 (user_id,)
@@ -296,117 +1328,437 @@ class Database:
                 return UserSettings(
                     user_id=row['user_id'],
                     reminder_days=row['reminder_days'],
-                    reminder_time=row['reminder_time']
+                    reminder_time=row['reminder_time'] or DEFAULT_REMINDER_TIME,
+                    timezone=row['timezone'] or DEFAULT_TIMEZONE
                 )
-            return UserSettings(user_id=user_id, reminder_days=7, reminder_time="10:00")
+            return UserSettings(user_id=user_id, reminder_days=7, reminder_time=DEFAULT_REMINDER_TIME)
 
     async def update_settings(self, user_id: int, **kwargs) -> bool:
-        allowed_fields = {'reminder_days', 'reminder_time'}
+        allowed_fields = {'reminder_days', 'reminder_time', 'timezone'}
         updates = {k: v for k, v in kwargs.items() if k in allowed_fields}
 
         if not updates:
             return False
 
-        async with aiosqlite.connect(self.db_path) as db:
+        # Новая строка получает значения по умолчанию, а не NULL
+        row = {
+            'reminder_days': DEFAULT_REMINDER_DAYS,
+            'reminder_time': DEFAULT_REMINDER_TIME,
+            'timezone': DEFAULT_TIMEZONE,
+            **updates
+        }
+        set_clause = ", ".join(f"{k} = excluded.{k}" for k in updates.keys())
+        await self.writes.execute(
+            f"""
+            INSERT INTO settings (user_id, reminder_days, reminder_time, timezone)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET {set_clause}
+            """,
+            (user_id, row['reminder_days'], row['reminder_time'], row['timezone'])
+        )
+        if 'timezone' in updates:
+            self._timezones.add(updates['timezone'])
+        return True
+
+    async def get_user_facets(self, user_id: int) -> UserFacets:
+        """Хостинги, локации и цены пользователя одним запросом, с кэшем."""
+        facets = self._facets.get(user_id)
+        if facets is not None:
+            self._facets.move_to_end(user_id)
+            return facets
+
+        version = self.cache.version(user_id)
+        async with self.pool.reader() as db:
             cursor = await db.execute(
-                "SELECT 1 FROM settings WHERE user_id = ?",
-                (user_id,)
+                """
+                SELECT 'hosting' AS facet, hosting AS value, NULL AS currency
+                FROM servers WHERE user_id = ? AND hosting != '' GROUP BY hosting
+                UNION ALL
+                SELECT 'location', location, NULL
+                FROM servers WHERE user_id = ? AND location != '' GROUP BY location
+                UNION ALL
+                SELECT 'price', price, currency
+                FROM servers WHERE user_id = ? GROUP BY price, currency
+                UNION ALL
+                SELECT 'tag', tag, NULL
+                FROM server_tags WHERE user_id = ? GROUP BY tag
+                ORDER BY facet, currency, value
+                """,
+                (user_id, user_id, user_id, user_id)
             )
-            exists = await cursor.fetchone()
+            rows = await cursor.fetchall()
 
-            if exists:
-                set_clause = ", ".join(f"{k} = ?" for k in updates.keys())
-                values = list(updates.values()) + [user_id]
-                await db.execute(
-                    f"UPDATE settings SET {set_clause} WHERE user_id = ?",
-                    values
-                )
+        facets = UserFacets(hostings=[], locations=[], prices=[])
+        for row in rows:
+            if row['facet'] == 'hosting':
+                facets.hostings.append(row['value'])
+            elif row['facet'] == 'location':
+                facets.locations.append(row['value'])
+            elif row['facet'] == 'tag':
+                facets.tags.append(row['value'])
             else:
-                columns = ['user_id'] + list(updates.keys())
-                placeholders = ", ".join("?" for _ in columns)
-                values = [user_id] + list(updates.values())
-                await db.execute(
-                    f"INSERT INTO settings ({', '.join(columns)}) VALUES ({placeholders})",
-                    values
-                )
+                facets.prices.append((row['value'], row['currency']))
 
-            await db.commit()
-            return True
+        if version == self.cache.version(user_id):
+            self._facets[user_id] = facets
+            if len(self._facets) > DB_FACETS_CACHE_SIZE:
+                self._facets.popitem(last=False)
+        return facets
 
-    async def get_all_users_with_settings(self) -> list[UserSettings]:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute(
+    # === Мониторинг ===
+
+    async def get_monitor_states(self) -> dict[int, MonitorState]:
+        """Сохранённые статусы мониторинга для восстановления после рестарта."""
+        async with self.pool.reader() as db:
+            cursor = await db.execute("SELECT * FROM monitor_state")
+            rows = await cursor.fetchall()
+            return {
+                row['server_id']: MonitorState(
+                    server_id=row['server_id'],
+                    is_online=bool(row['is_online']),
+                    changed_at=_parse_datetime(row['changed_at']),
+                    checked_at=_parse_datetime(row['checked_at']),
+                    last_port=row['last_port']
+                )
+                for row in rows
+            }
+
+    async def save_monitor_results(
+        self,
+        checks: list[MonitorCheck],
+        states: list[MonitorState],
+        alerts: Sequence[OutboxMessage] = ()
+    ):
+        """Записывает накопленные проверки, актуальные статусы и уведомления
+        об их смене одной транзакцией."""
+        async def op(db: aiosqlite.Connection):
+            await _insert_outbox(db, alerts)
+            await db.executemany(
                 """
-                SELECT DISTINCT s.user_id,
-                       COALESCE(st.reminder_days, 7) as reminder_days,
-                       COALESCE(st.reminder_time, '10:00') as reminder_time
-                FROM servers s
-                LEFT JOIN settings st ON s.user_id = st.user_id
+                INSERT INTO monitor_checks (server_id, checked_at, is_online, latency_ms, port, http_status)
+                SELECT ?, ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM servers WHERE id = ?)
+                """,
+                [
+                    (c.server_id, c.checked_at.isoformat(sep=' '), c.is_online,
+                     c.latency_ms, c.port, c.http_status, c.server_id)
+                    for c in checks
+                ]
+            )
+            # Пишем только для существующих серверов: удалённый за время
+            # накопления пачки сервер не должен воскреснуть в monitor_state
+            await db.executemany(
                 """
+                INSERT INTO monitor_state (server_id, is_online, changed_at, checked_at, last_port)
+                SELECT ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM servers WHERE id = ?)
+                ON CONFLICT(server_id) DO UPDATE SET
+                    is_online = excluded.is_online,
+                    changed_at = excluded.changed_at,
+                    checked_at = excluded.checked_at,
+                    last_port = excluded.last_port
+                """,
+                [
+                    (s.server_id, s.is_online, s.changed_at.isoformat(sep=' '),
+                     s.checked_at.isoformat(sep=' '), s.last_port, s.server_id)
+                    for s in states
+                ]
+            )
+
+        await self.writes.submit(op)
+
+    async def get_recent_checks(self, since: datetime) -> list[MonitorCheck]:
+        """Проверки начиная с since (UTC) по возрастанию времени."""
+        async with self.pool.reader() as db:
+            cursor = await db.execute(
+                "SELECT * FROM monitor_checks WHERE checked_at >= ? ORDER BY checked_at",
+                (since.isoformat(sep=' '),)
             )
             rows = await cursor.fetchall()
             return [
-                UserSettings(
-                    user_id=row['user_id'],
-                    reminder_days=row['reminder_days'],
-                    reminder_time=row['reminder_time']
+                MonitorCheck(
+                    server_id=row['server_id'],
+                    checked_at=_parse_datetime(row['checked_at']),
+                    is_online=bool(row['is_online']),
+                    latency_ms=row['latency_ms'],
+                    port=row['port'],
+                    http_status=row['http_status']
                 )
                 for row in rows
             ]
 
-    async def get_unique_hostings(self, user_id: int) -> list[str]:
-        """Возвращает уникальные хостинги пользователя."""
-        async with aiosqlite.connect(self.db_path) as db:
+    async def save_hourly_rollups(self, rollups: list[UptimeRollup]):
+        """Сохраняет часовые агрегаты и пересчитывает по ним суточные."""
+        day_starts = sorted({
+            r.bucket_start.replace(hour=0, minute=0, second=0, microsecond=0)
+            for r in rollups
+        })
+
+        async def op(db: aiosqlite.Connection):
+            await db.executemany(
+                """
+                INSERT INTO monitor_rollups (server_id, period, bucket_start, checks, up, min_ms, avg_ms, p95_ms)
+                SELECT ?, 'hour', ?, ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM servers WHERE id = ?)
+                ON CONFLICT(server_id, period, bucket_start) DO UPDATE SET
+                    checks = excluded.checks,
+                    up = excluded.up,
+                    min_ms = excluded.min_ms,
+                    avg_ms = excluded.avg_ms,
+                    p95_ms = excluded.p95_ms
+                """,
+                [
+                    (r.server_id, r.bucket_start.isoformat(sep=' '), r.checks, r.up,
+                     r.min_ms, r.avg_ms, r.p95_ms, r.server_id)
+                    for r in rollups
+                ]
+            )
+            # Сутки собираются из часов: средняя взвешена по числу успешных
+            # проверок, p95 суток — верхняя оценка (максимум часовых p95)
+            for day_start in day_starts:
+                await db.execute(
+                    """
+                    INSERT INTO monitor_rollups (server_id, period, bucket_start, checks, up, min_ms, avg_ms, p95_ms)
+                    SELECT server_id, 'day', ?, SUM(checks), SUM(up), MIN(min_ms),
+                           SUM(avg_ms * up) / SUM(CASE WHEN avg_ms IS NOT NULL THEN up END),
+                           MAX(p95_ms)
+                    FROM monitor_rollups
+                    WHERE period = 'hour' AND bucket_start >= ? AND bucket_start < datetime(?, '+1 day')
+                    GROUP BY server_id
+                    ON CONFLICT(server_id, period, bucket_start) DO UPDATE SET
+                        checks = excluded.checks,
+                        up = excluded.up,
+                        min_ms = excluded.min_ms,
+                        avg_ms = excluded.avg_ms,
+                        p95_ms = excluded.p95_ms
+                    """,
+                    (day_start.isoformat(sep=' '),) * 3
+                )
+
+        await self.writes.submit(op)
+
+    async def get_spend_aggregates(self, user_id: int) -> list[SpendAggregate]:
+        """Расходы пользователя по валютам и хостингам, приведённые к месяцу и году.
+
+        Период оплаты переводится в месяцы в SQL, см. _period_months_sql().
+        """
+        async with self.pool.reader() as db:
             cursor = await db.execute(
-                "SELECT DISTINCT hosting FROM servers WHERE user_id = ? ORDER BY hosting",
+                f"""
+                SELECT currency, hosting,
+                       COUNT(*) AS servers,
+                       SUM(price / months) AS monthly,
+                       SUM(price * 12 / months) AS yearly
+                FROM (
+                    SELECT currency, hosting, CAST(price AS REAL) AS price,
+                           {_period_months_sql("payment_period")} AS months
+                    FROM servers
+                    WHERE user_id = ?
+                )
+                GROUP BY currency, hosting
+                """,
                 (user_id,)
             )
             rows = await cursor.fetchall()
-            return [row[0] for row in rows if row[0]]
+            return [
+                SpendAggregate(
+                    currency=row['currency'],
+                    hosting=row['hosting'],
+                    servers=row['servers'],
+                    monthly=row['monthly'],
+                    yearly=row['yearly']
+                )
+                for row in rows
+            ]
+
+    async def get_uptime_summaries(
+        self,
+        user_id: int,
+        server_id: Optional[int] = None
+    ) -> dict[int, UptimeSummary]:
+        """SLA серверов пользователя по агрегатам: 24 часа по часовым, 30 дней по суточным."""
+        server_filter = "AND s.id = ?" if server_id is not None else ""
+        params = [user_id] + ([server_id] if server_id is not None else [])
 
-    async def get_unique_locations(self, user_id: int) -> list[str]:
-        """Возвращает уникальные локации пользователя."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.reader() as db:
             cursor = await db.execute(
-                "SELECT DISTINCT location FROM servers WHERE user_id = ? AND location IS NOT NULL ORDER BY location",
-                (user_id,)
+                f"""
+                SELECT r.server_id,
+                       SUM(CASE WHEN r.period = 'hour' THEN r.checks END) AS checks_24h,
+                       SUM(CASE WHEN r.period = 'hour' THEN r.up END) AS up_24h,
+                       SUM(CASE WHEN r.period = 'hour' THEN r.avg_ms * r.up END)
+                           / SUM(CASE WHEN r.period = 'hour' AND r.avg_ms IS NOT NULL THEN r.up END) AS avg_ms_24h,
+                       MAX(CASE WHEN r.period = 'hour' THEN r.p95_ms END) AS p95_ms_24h,
+                       SUM(CASE WHEN r.period = 'day' THEN r.checks END) AS checks_30d,
+                       SUM(CASE WHEN r.period = 'day' THEN r.up END) AS up_30d
+                FROM servers s
+                JOIN monitor_rollups r ON r.server_id = s.id
+                WHERE s.user_id = ? {server_filter}
+                  AND (
+                    (r.period = 'hour' AND r.bucket_start >= datetime('now', '-24 hours'))
+                    OR (r.period = 'day' AND r.bucket_start >= datetime('now', 'start of day', '-29 days'))
+                  )
+                GROUP BY r.server_id
+                """,
+                params
             )
             rows = await cursor.fetchall()
-            return [row[0] for row in rows if row[0]]
+            return {
+                row['server_id']: UptimeSummary(
+                    server_id=row['server_id'],
+                    uptime_24h=row['up_24h'] * 100 / row['checks_24h'] if row['checks_24h'] else None,
+                    uptime_30d=row['up_30d'] * 100 / row['checks_30d'] if row['checks_30d'] else None,
+                    avg_ms_24h=row['avg_ms_24h'],
+                    p95_ms_24h=row['p95_ms_24h']
+                )
+                for row in rows
+            }
+
+    async def prune_monitor_history(
+        self,
+        keep_days: int,
+        keep_hourly_days: int,
+        keep_daily_days: int
+    ) -> int:
+        """Удаляет старые проверки и агрегаты, статусы серверов, снятых с мониторинга."""
+        async def op(db: aiosqlite.Connection) -> int:
+            cursor = await db.execute(
+                "DELETE FROM monitor_checks WHERE checked_at < datetime('now', '-' || ? || ' days')",
+                (keep_days,)
+            )
+            await db.execute(
+                """
+                DELETE FROM monitor_rollups
+                WHERE (period = 'hour' AND bucket_start < datetime('now', '-' || ? || ' days'))
+                   OR (period = 'day' AND bucket_start < datetime('now', '-' || ? || ' days'))
+                """,
+                (keep_hourly_days, keep_daily_days)
+            )
+            await db.execute(
+                """
+                DELETE FROM monitor_state WHERE server_id NOT IN (
+                    SELECT id FROM servers WHERE is_monitoring = 1
+                )
+                """
+            )
+            return cursor.rowcount
+
+        return await self.writes.submit(op)
 
-    async def get_unique_prices(self, user_id: int) -> list[tuple[float, str]]:
-        """Возвращает уникальные цены пользователя (price, currency)."""
-        async with aiosqlite.connect(self.db_path) as db:
+    # === Outbox ===
+
+    async def enqueue_outbox(self, messages: Sequence[OutboxMessage]) -> int:
+        """Ставит уведомления в очередь, уже поставленные (по dedupe_key) пропускаются."""
+        async def op(db: aiosqlite.Connection) -> int:
+            return await _insert_outbox(db, messages)
+
+        return await self.writes.submit(op)
+
+    async def get_pending_outbox(
+        self,
+        digest_seconds: int,
+        limit: int,
+        skip_ids: Collection[int] = ()
+    ) -> list[OutboxMessage]:
+        """Неотправленные уведомления по порядку постановки.
+
+        Смены статуса пользователя отдаются все сразу, но только когда самой
+        старой из них исполнилось digest_seconds: за это время успевают
+        накопиться остальные смены для сводки. skip_ids — записи, которые
+        уже отправляются и ждут итога.
+        """
+        async with self.pool.reader() as db:
             cursor = await db.execute(
-                "SELECT DISTINCT price, currency FROM servers WHERE user_id = ? ORDER BY currency, price",
-                (user_id,)
+                """
+                SELECT * FROM outbox
+                WHERE status = 'pending'
+                  AND (
+                    kind != 'status'
+                    OR chat_id IN (
+                        SELECT chat_id FROM outbox
+                        WHERE status = 'pending' AND kind = 'status'
+                          AND created_at <= datetime('now', '-' || ? || ' seconds')
+                    )
+                  )
+                ORDER BY id
+                LIMIT ?
+                """,
+                (digest_seconds, limit + len(skip_ids))
             )
-            rows = await cursor.fetchall()
-            return [(row[0], row[1]) for row in rows]
+            rows = [row for row in await cursor.fetchall() if row['id'] not in skip_ids][:limit]
+            return [
+                OutboxMessage(
+                    chat_id=row['chat_id'],
+                    kind=row['kind'],
+                    dedupe_key=row['dedupe_key'],
+                    text=row['text'],
+                    server_id=row['server_id'],
+                    is_online=None if row['is_online'] is None else bool(row['is_online']),
+                    id=row['id'],
+                    created_at=_parse_datetime(row['created_at']),
+                    attempts=row['attempts']
+                )
+                for row in rows
+            ]
+
+    async def mark_outbox(
+        self,
+        sent_ids: list[int],
+        failed_ids: list[int],
+        max_attempts: int,
+        rejected_ids: Sequence[int] = ()
+    ):
+        """Отмечает отправленные уведомления; неотправленные остаются в очереди,
+        пока не исчерпают max_attempts попыток, отвергнутые Telegram — сразу failed."""
+        async def op(db: aiosqlite.Connection):
+            await db.executemany(
+                "UPDATE outbox SET status = 'sent', sent_at = CURRENT_TIMESTAMP WHERE id = ?",
+                [(message_id,) for message_id in sent_ids]
+            )
+            await db.executemany(
+                "UPDATE outbox SET status = 'failed', attempts = attempts + 1 WHERE id = ?",
+                [(message_id,) for message_id in rejected_ids]
+            )
+            await db.executemany(
+                """
+                UPDATE outbox SET
+                    attempts = attempts + 1,
+                    status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END
+                WHERE id = ?
+                """,
+                [(max_attempts, message_id) for message_id in failed_ids]
+            )
+
+        await self.writes.submit(op)
+
+    async def prune_outbox(self, keep_days: int) -> int:
+        """Удаляет отправленные и неудавшиеся уведомления старше keep_days."""
+        result = await self.writes.execute(
+            """
+            DELETE FROM outbox
+            WHERE status != 'pending' AND created_at < datetime('now', '-' || ? || ' days')
+            """,
+            (keep_days,)
+        )
+        return result.rowcount
 
     # === API Keys ===
 
     async def save_api_key(self, user_id: int, provider: str, api_key: str) -> bool:
         """Сохранить или обновить API ключ (с шифрованием)."""
         encrypted_key = encrypt_api_key(api_key)
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                """
-                INSERT INTO api_keys (user_id, provider, api_key)
-                VALUES (?, ?, ?)
-                ON CONFLICT(user_id, provider) DO UPDATE SET
-                    api_key = excluded.api_key,
-                    created_at = CURRENT_TIMESTAMP
-                """,
-                (user_id, provider.lower(), encrypted_key)
-            )
-            await db.commit()
-            return True
+        await self.writes.execute(
+            """
+            INSERT INTO api_keys (user_id, provider, api_key)
+            VALUES (?, ?, ?)
+            ON CONFLICT(user_id, provider) DO UPDATE SET
+                api_key = excluded.api_key,
+                created_at = CURRENT_TIMESTAMP
+            """,
+            (user_id, provider.lower(), encrypted_key)
+        )
+        return True
 
     async def get_api_key(self, user_id: int, provider: str) -> Optional[str]:
         """Получить API ключ пользователя (с расшифровкой)."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.reader() as db:
             cursor = await db.execute(
                 "SELECT api_key FROM api_keys WHERE user_id = ? AND provider = ?",
                 (user_id, provider.lower())
@@ -418,8 +1770,7 @@ class Database:
 
     async def get_user_api_keys(self, user_id: int) -> list[HostingAPIKey]:
         """Получить все API ключи пользователя."""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.pool.reader() as db:
             cursor = await db.execute(
                 "SELECT * FROM api_keys WHERE user_id = ?",
                 (user_id,)
@@ -438,69 +1789,87 @@ class Database:
 
     async def delete_api_key(self, user_id: int, provider: str) -> bool:
         """Удалить API ключ."""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                "DELETE FROM api_keys WHERE user_id = ? AND provider = ?",
-                (user_id, provider.lower())
-            )
-            await db.commit()
-            return cursor.rowcount > 0
+        result = await self.writes.execute(
+            "DELETE FROM api_keys WHERE user_id = ? AND provider = ?",
+            (user_id, provider.lower())
+        )
+        return result.rowcount > 0
 
-    async def get_server_by_external_id(self, user_id: int, provider: str, external_id: str) -> Optional[Server]:
-        """Найти сервер по external_id от хостинга."""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+    async def get_imported_external_ids(self, user_id: int, provider: str) -> set[str]:
+        """external_id серверов хостинга, которые уже есть в боте."""
+        async with self.pool.reader() as db:
             cursor = await db.execute(
-                "SELECT * FROM servers WHERE user_id = ? AND provider = ? AND external_id = ?",
-                (user_id, provider.lower(), external_id)
+                "SELECT external_id FROM servers WHERE user_id = ? AND provider = ? AND external_id IS NOT NULL",
+                (user_id, provider.lower())
             )
-            row = await cursor.fetchone()
-            if row:
-                return self._row_to_server(row)
-            return None
+            rows = await cursor.fetchall()
+            return {row[0] for row in rows}
 
-    async def add_or_update_server_from_hosting(
+    async def bulk_upsert_hosting_servers(
         self,
         user_id: int,
         provider: str,
-        external_id: str,
-        name: str,
-        expiry_date: date,
-        price: float,
-        currency: str = "RUB",
-        ip: Optional[str] = None,
-        location: Optional[str] = None
-    ) -> int:
-        """Добавить или обновить сервер из хостинга."""
-        existing = await self.get_server_by_external_id(user_id, provider, external_id)
-
-        if existing:
-            # Обновляем существующий
-            await self.update_server(
-                existing.id,
-                user_id,
-                name=name,
-                expiry_date=expiry_date,
-                price=price,
-                currency=currency,
-                ip=ip,
-                location=location
-            )
-            return existing.id
-        else:
-            # Создаём новый
-            async with aiosqlite.connect(self.db_path) as db:
-                cursor = await db.execute(
+        servers: list["HostingServer"],
+        insert_new: bool = True
+    ) -> tuple[int, int]:
+        """Импорт/синхронизация серверов хостинга одной транзакцией.
+
+        Существующим серверам обновляются дата, цена, IP и локация.
+        При insert_new=False новые серверы не добавляются.
+        Возвращает (добавлено, обновлено).
+        """
+        provider = provider.lower()
+        incoming = {s.external_id for s in servers}
+
+        async def op(db: aiosqlite.Connection) -> tuple[int, int]:
+            cursor = await db.execute(
+                "SELECT external_id FROM servers WHERE user_id = ? AND provider = ? AND external_id IS NOT NULL",
+                (user_id, provider)
+            )
+            existing = {row[0] for row in await cursor.fetchall()}
+
+            if insert_new:
+                await db.executemany(
                     """
                     INSERT INTO servers (user_id, name, hosting, location, ip, expiry_date,
                                          price, currency, payment_period, provider, external_id)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'monthly', ?, ?)
+                    ON CONFLICT(user_id, provider, external_id) DO UPDATE SET
+                        expiry_date = excluded.expiry_date,
+                        price = excluded.price,
+                        ip = excluded.ip,
+                        location = excluded.location
+                    """,
+                    [
+                        (user_id, s.name, provider.upper(), s.location, s.ip, s.expiry_date.isoformat(),
+                         s.price, s.currency, provider, s.external_id)
+                        for s in servers
+                    ]
+                )
+                inserted = len(incoming - existing)
+            else:
+                await db.executemany(
+                    """
+                    UPDATE servers SET expiry_date = ?, price = ?, ip = ?, location = ?
+                    WHERE user_id = ? AND provider = ? AND external_id = ?
                     """,
-                    (user_id, name, provider.upper(), location, ip, expiry_date.isoformat(),
-                     price, currency, "monthly", provider.lower(), external_id)
+                    [
+                        (s.expiry_date.isoformat(), s.price, s.ip, s.location,
+                         user_id, provider, s.external_id)
+                        for s in servers if s.external_id in existing
+                    ]
                 )
-                await db.commit()
-                return cursor.lastrowid
+                inserted = 0
+
+            if inserted:
+                await _ensure_settings(db, user_id)
+            return inserted, len(incoming & existing)
+
+        result = await self.writes.submit(op)
+        # executemany не отдаёт RETURNING, поэтому индекс пользователя перечитывается целиком
+        self._servers_changed(user_id)
+        self.expiry.replace_user(user_id, await self.get_all_servers(user_id))
+        return result
 
     def _row_to_server(self, row) -> Server:
         expiry = row['expiry_date']
@@ -526,8 +1895,192 @@ class Database:
             notes=row['notes'],
             tags=row['tags'],
             is_monitoring=bool(row['is_monitoring']),
-            created_at=created
+            created_at=created,
+            monitoring_ports=row['monitoring_ports']
         )
 
 
+async def _sync_server_tags(db: aiosqlite.Connection, servers: Sequence[Server]):
+    """Пересобирает строки server_tags по колонке tags серверов."""
+    if not servers:
+        return
+    await db.execute(
+        f"DELETE FROM server_tags WHERE server_id IN ({', '.join('?' * len(servers))})",
+        [server.id for server in servers]
+    )
+    await db.executemany(
+        "INSERT OR IGNORE INTO server_tags (user_id, tag, server_id) VALUES (?, ?, ?)",
+        [(server.user_id, tag, server.id) for server in servers for tag in split_tags(server.tags)]
+    )
+
+
+async def _ensure_settings(db: aiosqlite.Connection, user_id: int):
+    """Создаёт строку настроек по умолчанию, если её ещё нет."""
+    await db.execute(
+        """
+        INSERT OR IGNORE INTO settings (user_id, reminder_days, reminder_time, timezone)
+        VALUES (?, ?, ?, ?)
+        """,
+        (user_id, DEFAULT_REMINDER_DAYS, DEFAULT_REMINDER_TIME, DEFAULT_TIMEZONE)
+    )
+
+
+async def _insert_outbox(db: aiosqlite.Connection, messages: Sequence[OutboxMessage]) -> int:
+    if not messages:
+        return 0
+    before = db.total_changes
+    await db.executemany(
+        """
+        INSERT INTO outbox (chat_id, kind, dedupe_key, text, server_id, is_online)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(dedupe_key) DO NOTHING
+        """,
+        [
+            (m.chat_id, m.kind, m.dedupe_key, m.text, m.server_id, m.is_online)
+            for m in messages
+        ]
+    )
+    return db.total_changes - before
+
+
+def split_tags(tags: Optional[str]) -> list[str]:
+    """Теги из строки через запятую, в нижнем регистре, без повторов."""
+    result = []
+    for tag in (tags or "").split(","):
+        tag = tag.strip().lower()
+        if tag and tag not in result:
+            result.append(tag)
+    return result
+
+
+def period_months(payment_period: Optional[str]) -> int:
+    """Длительность периода оплаты в месяцах; неизвестный период считается месячным."""
+    months = {"monthly": 1, "quarterly": 3, "halfyear": 6, "yearly": 12}.get(payment_period or "")
+    if months:
+        return months
+    if payment_period and payment_period.startswith("custom_"):
+        try:
+            return max(1, int(payment_period.split("_")[1]))
+        except (IndexError, ValueError):
+            pass
+    return 1
+
+
+# Порядки постраничного списка: сегменты (условие, ключ сортировки). Строки
+# сегмента идут по ключу, сегменты — друг за другом, поэтому серверы без
+# локации оказываются в конце, а каждый сегмент читается по своему индексу
+_LIST_ORDERS = {
+    "date": [("1", ("expiry_date", "id"))],
+    "hosting": [("1", ("hosting COLLATE NOCASE", "expiry_date", "id"))],
+    "location": [
+        ("location IS NOT NULL", ("location COLLATE NOCASE", "expiry_date", "id")),
+        ("location IS NULL", ("expiry_date", "id")),
+    ],
+}
+
+
+async def _read_list_rows(
+    db: aiosqlite.Connection,
+    user_id: int,
+    segments: list[tuple[str, tuple[str, ...]]],
+    start: int,
+    anchor,
+    backward: bool,
+    filter_sql: str,
+    filter_params: list[Any],
+    limit: int
+) -> list:
+    """До limit + 1 строк списка от курсора anchor по сегментам порядка сортировки.
+
+    Без курсора чтение начинается с края сегмента start.
+    """
+    direction, op = ("DESC", "<") if backward else ("ASC", ">")
+    order = range(start, -1, -1) if backward else range(start, len(segments))
+    rows = []
+    for i in order:
+        cond, key = segments[i]
+        sql = f"SELECT * FROM servers WHERE user_id = ? AND {cond}{filter_sql}"
+        params: list[Any] = [user_id, *filter_params]
+        if anchor is not None and i == start:
+            # Отдельное условие на первую колонку даёт поиск по индексу,
+            # сравнение кортежей — точную позицию курсора
+            values = [anchor[column.split()[0]] for column in key]
+            sql += f" AND {key[0]} {op}= ? AND ({', '.join(key)}) {op} ({', '.join('?' * len(key))})"
+            params += [values[0], *values]
+        sql += " ORDER BY " + ", ".join(f"{column} {direction}" for column in key) + " LIMIT ?"
+        params.append(limit + 1 - len(rows))
+        rows += await db.execute_fetchall(sql, params)
+        if len(rows) > limit:
+            break
+    return rows
+
+
+def _filter_sql(user_id: int, filters: Optional[ServerFilter]) -> tuple[str, list[Any]]:
+    """Условия фильтра для WHERE (с ведущим AND) и их параметры.
+
+    Хостинг и локация сравниваются без учёта регистра, как в индексах
+    idx_servers_user_hosting и idx_servers_user_location, тег ищется
+    по первичному ключу server_tags.
+    """
+    if filters is None:
+        return "", []
+
+    sql, params = "", []
+    if filters.hosting is not None:
+        sql += " AND hosting COLLATE NOCASE = ?"
+        params.append(filters.hosting)
+    if filters.location is not None:
+        sql += " AND location COLLATE NOCASE = ?"
+        params.append(filters.location)
+    if filters.tag is not None:
+        sql += " AND id IN (SELECT server_id FROM server_tags WHERE user_id = ? AND tag = ?)"
+        params += [user_id, filters.tag.lower()]
+    if filters.due_days is not None:
+        sql += " AND expiry_date <= ?"
+        params.append((date.today() + timedelta(days=filters.due_days)).isoformat())
+    return sql, params
+
+
+def _server_updates(kwargs: dict[str, Any]) -> dict[str, Any]:
+    """Оставляет изменяемые поля сервера и приводит даты к строкам."""
+    allowed_fields = {
+        'name', 'hosting', 'location', 'ip', 'url', 'expiry_date', 'price',
+        'currency', 'payment_period', 'notes', 'tags', 'is_monitoring',
+        'monitoring_ports'
+    }
+
+    updates = {k: v for k, v in kwargs.items() if k in allowed_fields}
+    if 'expiry_date' in updates and isinstance(updates['expiry_date'], date):
+        updates['expiry_date'] = updates['expiry_date'].isoformat()
+    return updates
+
+
+def _advance_expiry_sql(months: str) -> str:
+    """SQL-выражение: expiry_date + months месяцев с поправкой на конец месяца, как relativedelta."""
+    return f"""MIN(
+        date(expiry_date, 'start of month', '+' || ({months}) || ' months',
+             '+' || (CAST(strftime('%d', expiry_date) AS INTEGER) - 1) || ' days'),
+        date(expiry_date, 'start of month', '+' || ({months} + 1) || ' months', '-1 day')
+    )"""
+
+
+def _period_months_sql(period: str) -> str:
+    """SQL-выражение period_months() для выражения period (колонки или параметра)."""
+    return f"""CASE
+        WHEN {period} = 'monthly' THEN 1
+        WHEN {period} = 'quarterly' THEN 3
+        WHEN {period} = 'halfyear' THEN 6
+        WHEN {period} = 'yearly' THEN 12
+        WHEN {period} LIKE 'custom\\_%' ESCAPE '\\' AND CAST(substr({period}, 8) AS INTEGER) > 0
+            THEN CAST(substr({period}, 8) AS INTEGER)
+        ELSE 1
+    END"""
+
+
+def _parse_datetime(value) -> datetime:
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
 db = Database()
@@ -3,6 +3,8 @@
 Синхронизация, импорт серверов.
 """
 
+from datetime import date
+
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
@@ -11,7 +13,7 @@ from aiogram.fsm.state import State, StatesGroup
 
 from database import db
 from keyboards import get_cancel_keyboard, get_back_keyboard
-from services.hosting_api import FourVPSClient, get_hosting_client
+from services.hosting_api import FourVPSClient, HostingServer, get_hosting_client
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
@@ -237,19 +239,9 @@ async def cb_sync_servers(callback: CallbackQuery):
         return
 
     # Обновляем существующие серверы
-    updated = 0
-    for server in servers:
-        existing = await db.get_server_by_external_id(callback.from_user.id, "4vps", server.external_id)
-        if existing:
-            await db.update_server(
-                existing.id,
-                callback.from_user.id,
-                expiry_date=server.expiry_date,
-                price=server.price,
-                ip=server.ip,
-                location=server.location
-            )
-            updated += 1
+    _, updated = await db.bulk_upsert_hosting_servers(
+        callback.from_user.id, "4vps", servers, insert_new=False
+    )
 
     text = (
         f"✅ <b>Синхронизация завершена</b>\n"
@@ -301,11 +293,8 @@ async def cb_import_servers(callback: CallbackQuery, state: FSMContext):
     )
 
     # Проверяем какие уже импортированы
-    imported_ids = set()
-    for server in servers:
-        existing = await db.get_server_by_external_id(callback.from_user.id, "4vps", server.external_id)
-        if existing:
-            imported_ids.add(server.external_id)
+    known_ids = await db.get_imported_external_ids(callback.from_user.id, "4vps")
+    imported_ids = {s.external_id for s in servers if s.external_id in known_ids}
 
     text = (
         f"📥 <b>Импорт серверов</b>\n"
@@ -334,37 +323,21 @@ async def cb_import_all(callback: CallbackQuery, state: FSMContext):
 
     await callback.answer("📥 Импортирую...")
 
-    imported = 0
-    updated = 0
-
-    for s in servers_data:
-        from datetime import date
-        expiry = date.fromisoformat(s['expiry_date'])
-
-        existing = await db.get_server_by_external_id(callback.from_user.id, "4vps", s['external_id'])
-        if existing:
-            await db.update_server(
-                existing.id,
-                callback.from_user.id,
-                expiry_date=expiry,
-                price=s['price'],
-                ip=s['ip'],
-                location=s['location']
-            )
-            updated += 1
-        else:
-            await db.add_or_update_server_from_hosting(
-                user_id=callback.from_user.id,
-                provider="4vps",
-                external_id=s['external_id'],
-                name=s['name'],
-                expiry_date=expiry,
-                price=s['price'],
-                currency=s['currency'],
-                ip=s['ip'],
-                location=s['location']
-            )
-            imported += 1
+    servers = [
+        HostingServer(
+            external_id=s['external_id'],
+            name=s['name'],
+            ip=s['ip'],
+            price=s['price'],
+            currency=s['currency'],
+            expiry_date=date.fromisoformat(s['expiry_date']),
+            status="active",
+            hosting=FourVPSClient.HOSTING_NAME,
+            location=s['location']
+        )
+        for s in servers_data
+    ]
+    imported, updated = await db.bulk_upsert_hosting_servers(callback.from_user.id, "4vps", servers)
 
     await state.clear()
 
@@ -1,23 +1,29 @@
+from dataclasses import asdict
+from typing import Optional
+
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from database import db
+from database import db, Server, ServerFilter
 from keyboards import (
     get_main_menu, get_server_list_keyboard, get_server_detail_keyboard,
     get_delete_confirm_keyboard, get_edit_server_keyboard, get_currency_keyboard,
     get_period_keyboard, get_cancel_keyboard, get_skip_keyboard, get_settings_keyboard,
     get_back_keyboard, get_hosting_choice_keyboard, get_location_choice_keyboard,
     get_price_choice_keyboard, get_server_list_keyboard_with_sort,
-    get_payment_confirm_keyboard, get_payment_change_keyboard
+    get_payment_confirm_keyboard, get_payment_change_keyboard, get_bulk_delete_confirm_keyboard,
+    get_filter_keyboard
 )
 from utils import (
-    format_server_info, format_server_list_sorted, format_expiring_servers,
-    parse_date, parse_price, get_period_text
+    format_server_info, format_server_list_page, format_expiring_servers,
+    parse_date, parse_price, parse_ports, get_period_text,
+    format_settings, parse_reminder_time, parse_timezone, format_main_menu, format_filter
 )
 from security import is_valid_ip, is_safe_url, is_safe_ip_for_monitoring, sanitize_text
+from services.monitoring import MonitoringService
 
 router = Router()
 
@@ -44,6 +50,11 @@ class EditServerStates(StatesGroup):
     waiting_value = State()
 
 
+class SettingsStates(StatesGroup):
+    reminder_time = State()
+    timezone = State()
+
+
 class PaymentStates(StatesGroup):
     waiting_price = State()
     waiting_currency = State()
@@ -51,26 +62,14 @@ class PaymentStates(StatesGroup):
     waiting_period_custom = State()
 
 
+class BulkStates(StatesGroup):
+    tags = State()
+
+
 @router.message(Command("start"))
 async def cmd_start(message: Message):
-    # Получаем статистику для приветствия
-    servers = await db.get_all_servers(message.from_user.id)
-    servers_count = len(servers)
-
-    if servers_count > 0:
-        from datetime import date
-        expiring = sum(1 for s in servers if (s.expiry_date - date.today()).days <= 7)
-        expiring_text = f"\n⚠️ Требуют внимания: <b>{expiring}</b>" if expiring > 0 else ""
-        stats_text = f"📊 Серверов: <b>{servers_count}</b>{expiring_text}"
-    else:
-        stats_text = "👋 Добавьте первый сервер"
-
-    text = (
-        f"🖥 <b>Server Manager</b>\n"
-        f"━━━━━━━━━━━━━━━━━━━━━━\n\n"
-        f"{stats_text}\n\n"
-        f"━━━━━━━━━━━━━━━━━━━━━━"
-    )
+    # Сводка ведётся в памяти и обновляется при каждом изменении серверов
+    text = format_main_menu(db.expiry.summary(message.from_user.id))
     await message.answer(text, reply_markup=get_main_menu(), parse_mode="HTML")
 
 
@@ -85,6 +84,7 @@ async def cmd_help(message: Message):
         "├ /list — список серверов\n"
         "├ /expiring — срочные к оплате\n"
         "├ /stats — статистика\n"
+        "├ /uptime — аптайм серверов\n"
         "├ /settings — настройки\n"
         "└ /help — эта справка\n\n"
         "<b>Как добавить сервер:</b>\n"
@@ -102,24 +102,8 @@ async def cmd_help(message: Message):
 async def cb_main_menu(callback: CallbackQuery, state: FSMContext):
     await state.clear()
 
-    # Получаем статистику
-    servers = await db.get_all_servers(callback.from_user.id)
-    servers_count = len(servers)
-
-    if servers_count > 0:
-        from datetime import date
-        expiring = sum(1 for s in servers if (s.expiry_date - date.today()).days <= 7)
-        expiring_text = f"\n⚠️ Требуют внимания: <b>{expiring}</b>" if expiring > 0 else ""
-        stats_text = f"📊 Серверов: <b>{servers_count}</b>{expiring_text}"
-    else:
-        stats_text = "👋 Добавьте первый сервер"
-
-    text = (
-        f"🖥 <b>Server Manager</b>\n"
-        f"━━━━━━━━━━━━━━━━━━━━━━\n\n"
-        f"{stats_text}\n\n"
-        f"━━━━━━━━━━━━━━━━━━━━━━"
-    )
+    # Сводка ведётся в памяти и обновляется при каждом изменении серверов
+    text = format_main_menu(db.expiry.summary(callback.from_user.id))
     await callback.message.edit_text(text, reply_markup=get_main_menu(), parse_mode="HTML")
     await callback.answer()
 
@@ -145,7 +129,7 @@ async def process_name(message: Message, state: FSMContext):
     user_id = message.from_user.id
 
     # Получаем существующие хостинги
-    hostings = await db.get_unique_hostings(user_id)
+    hostings = (await db.get_user_facets(user_id)).hostings
 
     if hostings:
         await state.set_state(AddServerStates.hosting_choice)
@@ -193,7 +177,7 @@ async def process_hosting_input(message: Message, state: FSMContext):
 async def ask_location(event: Message | CallbackQuery, state: FSMContext):
     """Запрашивает локацию."""
     user_id = event.from_user.id
-    locations = await db.get_unique_locations(user_id)
+    locations = (await db.get_user_facets(user_id)).locations
 
     text = "📍 Выберите <b>локацию</b> сервера:"
 
@@ -284,7 +268,7 @@ async def process_expiry_date(message: Message, state: FSMContext):
 async def ask_price(event: Message | CallbackQuery, state: FSMContext):
     """Запрашивает цену."""
     user_id = event.from_user.id
-    prices = await db.get_unique_prices(user_id)
+    prices = (await db.get_user_facets(user_id)).prices
 
     if prices:
         await state.set_state(AddServerStates.price_choice)
@@ -588,42 +572,126 @@ async def cancel_action(callback: CallbackQuery, state: FSMContext):
 
 # === Список серверов ===
 
-@router.message(Command("list"))
-async def cmd_list(message: Message, state: FSMContext):
-    servers = await db.get_all_servers(message.from_user.id)
+async def get_list_view(user_id: int, state: FSMContext) -> tuple[str, InlineKeyboardMarkup]:
+    """Текущая страница списка серверов: текст и клавиатура.
+
+    В FSM хранятся сортировка, фильтр, курсор страницы и, в режиме выбора,
+    id отмеченных серверов.
+    """
     data = await state.get_data()
     current_sort = data.get('sort', 'date')
-    text = format_server_list_sorted(servers, current_sort)
-    await message.answer(text, reply_markup=get_server_list_keyboard_with_sort(servers, current_sort), parse_mode="HTML")
+    filters = get_list_filter(data)
+    cursor = data.get('page') or {}
+    page = await db.list_servers_page(
+        user_id, current_sort, after=cursor.get('after'), before=cursor.get('before'), filters=filters
+    )
+    text = format_server_list_page(page, db.expiry.summary(user_id), current_sort, filters)
+
+    bulk_ids = data.get('bulk_ids')
+    if bulk_ids is None:
+        return text, get_server_list_keyboard_with_sort(page, current_sort, active_filters=filters.active)
+
+    text += f"\n\n☑️ Выбрано: <b>{len(bulk_ids)}</b> — отметьте серверы и выберите действие"
+    return text, get_server_list_keyboard_with_sort(page, current_sort, set(bulk_ids))
+
+
+async def show_list_view(callback: CallbackQuery, state: FSMContext):
+    text, keyboard = await get_list_view(callback.from_user.id, state)
+    await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+
+
+def get_list_filter(data: dict) -> ServerFilter:
+    """Фильтр списка из данных FSM."""
+    return ServerFilter(**(data.get('filters') or {}))
+
+
+@router.message(Command("list"))
+async def cmd_list(message: Message, state: FSMContext):
+    await state.update_data(page=None, bulk_ids=None)
+    text, keyboard = await get_list_view(message.from_user.id, state)
+    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
 
 
 @router.callback_query(F.data == "list_servers")
 async def cb_list_servers(callback: CallbackQuery, state: FSMContext):
-    servers = await db.get_all_servers(callback.from_user.id)
-    data = await state.get_data()
-    current_sort = data.get('sort', 'date')
-    text = format_server_list_sorted(servers, current_sort)
-    await callback.message.edit_text(
-        text,
-        reply_markup=get_server_list_keyboard_with_sort(servers, current_sort),
-        parse_mode="HTML"
-    )
+    await state.update_data(page=None, bulk_ids=None)
+    await show_list_view(callback, state)
     await callback.answer()
 
 
 @router.callback_query(F.data.startswith("sort_"))
 async def cb_sort_servers(callback: CallbackQuery, state: FSMContext):
     sort_type = callback.data.replace("sort_", "")
-    await state.update_data(sort=sort_type)
+    await state.update_data(sort=sort_type, page=None)
+    await show_list_view(callback, state)
+    await callback.answer(f"Сортировка: {sort_type}")
+
+
+# === Фильтр списка ===
 
-    servers = await db.get_all_servers(callback.from_user.id)
-    text = format_server_list_sorted(servers, sort_type)
+async def show_filter_menu(callback: CallbackQuery, state: FSMContext):
+    filters = get_list_filter(await state.get_data())
+    facets = await db.get_user_facets(callback.from_user.id)
+    text = "🔎 <b>Фильтр списка</b>\n\nВыбранные условия объединяются"
+    if filters.active:
+        text += f"\n\n{format_filter(filters)}"
     await callback.message.edit_text(
         text,
-        reply_markup=get_server_list_keyboard_with_sort(servers, sort_type),
+        reply_markup=get_filter_keyboard(facets, filters),
         parse_mode="HTML"
     )
-    await callback.answer(f"Сортировка: {sort_type}")
+
+
+@router.callback_query(F.data == "filters")
+async def cb_filters(callback: CallbackQuery, state: FSMContext):
+    await show_filter_menu(callback, state)
+    await callback.answer()
+
+
+@router.callback_query(F.data.regexp(r"^flt_[hltd]_-?\d+$"))
+async def cb_filter_chip(callback: CallbackQuery, state: FSMContext):
+    """Включает условие фильтра, а если оно уже выбрано — снимает."""
+    _, kind, raw = callback.data.split("_")
+    number = int(raw)
+    filters = get_list_filter(await state.get_data())
+
+    if kind == "d":
+        field, value = "due_days", number
+    else:
+        # Кнопка хранит номер значения в подсказках пользователя
+        facets = await db.get_user_facets(callback.from_user.id)
+        field, values = {
+            "h": ("hosting", facets.hostings),
+            "l": ("location", facets.locations),
+            "t": ("tag", facets.tags),
+        }[kind]
+        if number >= len(values):
+            await show_filter_menu(callback, state)
+            await callback.answer()
+            return
+        value = values[number]
+
+    setattr(filters, field, None if getattr(filters, field) == value else value)
+    await state.update_data(filters=asdict(filters), page=None)
+    await show_filter_menu(callback, state)
+    await callback.answer()
+
+
+@router.callback_query(F.data.in_({"flt_reset", "flt_done"}))
+async def cb_filter_done(callback: CallbackQuery, state: FSMContext):
+    if callback.data == "flt_reset":
+        await state.update_data(filters=None)
+    await state.update_data(page=None)
+    await show_list_view(callback, state)
+    await callback.answer()
+
+
+@router.callback_query(F.data.regexp(r"^page_[ab]_\d+$"))
+async def cb_list_page(callback: CallbackQuery, state: FSMContext):
+    _, direction, server_id = callback.data.split("_")
+    await state.update_data(page={"after" if direction == "a" else "before": int(server_id)})
+    await show_list_view(callback, state)
+    await callback.answer()
 
 
 # === Детали сервера ===
@@ -637,7 +705,12 @@ async def cb_server_detail(callback: CallbackQuery):
         await callback.answer("❌ Сервер не найден", show_alert=True)
         return
 
-    text = format_server_info(server, detailed=True)
+    uptime = None
+    if server.is_monitoring:
+        summaries = await db.get_uptime_summaries(callback.from_user.id, server.id)
+        uptime = summaries.get(server.id)
+
+    text = format_server_info(server, detailed=True, uptime=uptime)
     await callback.message.edit_text(
         text,
         reply_markup=get_server_detail_keyboard(server),
@@ -677,12 +750,11 @@ async def cb_mark_paid(callback: CallbackQuery):
 async def cb_pay_same(callback: CallbackQuery):
     """Оплата с теми же условиями."""
     server_id = int(callback.data.split("_")[2])
-    new_date = await db.mark_paid(server_id, callback.from_user.id)
+    server = await db.mark_paid(server_id, callback.from_user.id)
 
-    if new_date:
-        server = await db.get_server(server_id, callback.from_user.id)
+    if server:
         text = f"✅ <b>Оплата отмечена!</b>\n\n"
-        text += f"📅 Следующая оплата: <b>{new_date.strftime('%d.%m.%Y')}</b>\n\n"
+        text += f"📅 Следующая оплата: <b>{server.expiry_date.strftime('%d.%m.%Y')}</b>\n\n"
         text += format_server_info(server, detailed=True)
         await callback.message.edit_text(
             text,
@@ -761,16 +833,18 @@ async def process_pay_currency(callback: CallbackQuery, state: FSMContext):
     server_id = data['pay_server_id']
     new_price = data['pay_new_price']
 
-    # Обновляем цену и отмечаем оплату
-    await db.update_server(server_id, callback.from_user.id, price=new_price, currency=currency)
-    new_date = await db.mark_paid(server_id, callback.from_user.id)
+    # Обновляем цену и отмечаем оплату одним запросом
+    server = await db.mark_paid(server_id, callback.from_user.id, price=new_price, currency=currency)
 
     await state.clear()
 
-    server = await db.get_server(server_id, callback.from_user.id)
+    if not server:
+        await callback.answer("❌ Сервер не найден", show_alert=True)
+        return
+
     text = f"✅ <b>Оплата отмечена!</b>\n\n"
     text += f"💰 Новая цена: <b>{new_price:.2f} {currency}</b>\n"
-    text += f"📅 Следующая оплата: <b>{new_date.strftime('%d.%m.%Y')}</b>\n\n"
+    text += f"📅 Следующая оплата: <b>{server.expiry_date.strftime('%d.%m.%Y')}</b>\n\n"
     text += format_server_info(server, detailed=True)
     await callback.message.edit_text(
         text,
@@ -823,17 +897,19 @@ async def process_pay_period(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
         return
 
-    # Обновляем период и отмечаем оплату
-    await db.update_server(server_id, callback.from_user.id, payment_period=period)
-    new_date = await db.mark_paid(server_id, callback.from_user.id)
+    # Обновляем период и отмечаем оплату одним запросом
+    server = await db.mark_paid(server_id, callback.from_user.id, payment_period=period)
 
     await state.clear()
 
-    server = await db.get_server(server_id, callback.from_user.id)
+    if not server:
+        await callback.answer("❌ Сервер не найден", show_alert=True)
+        return
+
     period_text_full = get_period_text(period)
     text = f"✅ <b>Оплата отмечена!</b>\n\n"
     text += f"📆 Новый период: <b>{period_text_full}</b>\n"
-    text += f"📅 Следующая оплата: <b>{new_date.strftime('%d.%m.%Y')}</b>\n\n"
+    text += f"📅 Следующая оплата: <b>{server.expiry_date.strftime('%d.%m.%Y')}</b>\n\n"
     text += format_server_info(server, detailed=True)
     await callback.message.edit_text(
         text,
@@ -862,16 +938,18 @@ async def process_pay_period_custom(message: Message, state: FSMContext):
     server_id = data['pay_server_id']
     period = f"custom_{months}"
 
-    # Обновляем период и отмечаем оплату
-    await db.update_server(server_id, message.from_user.id, payment_period=period)
-    new_date = await db.mark_paid(server_id, message.from_user.id)
+    # Обновляем период и отмечаем оплату одним запросом
+    server = await db.mark_paid(server_id, message.from_user.id, payment_period=period)
 
     await state.clear()
 
-    server = await db.get_server(server_id, message.from_user.id)
+    if not server:
+        await message.answer("❌ Сервер не найден", reply_markup=get_back_keyboard())
+        return
+
     text = f"✅ <b>Оплата отмечена!</b>\n\n"
     text += f"📆 Новый период: <b>{months} мес</b>\n"
-    text += f"📅 Следующая оплата: <b>{new_date.strftime('%d.%m.%Y')}</b>\n\n"
+    text += f"📅 Следующая оплата: <b>{server.expiry_date.strftime('%d.%m.%Y')}</b>\n\n"
     text += format_server_info(server, detailed=True)
     await message.answer(
         text,
@@ -949,11 +1027,12 @@ async def cb_delete_server(callback: CallbackQuery):
 
 
 @router.callback_query(F.data.startswith("confirm_delete_"))
-async def cb_confirm_delete(callback: CallbackQuery):
+async def cb_confirm_delete(callback: CallbackQuery, monitoring: MonitoringService):
     server_id = int(callback.data.split("_")[2])
     success = await db.delete_server(server_id, callback.from_user.id)
 
     if success:
+        monitoring.untrack(server_id)
         await callback.message.edit_text(
             "🗑 <b>Сервер удалён</b>",
             reply_markup=get_back_keyboard("list_servers"),
@@ -985,7 +1064,7 @@ async def cb_edit_server(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data.regexp(r"edit_(name|hosting|location|ip|url|expiry|price|notes|tags)_\d+"))
+@router.callback_query(F.data.regexp(r"edit_(name|hosting|location|ip|url|expiry|price|notes|tags|ports)_\d+"))
 async def cb_edit_field(callback: CallbackQuery, state: FSMContext):
     parts = callback.data.split("_")
     field = parts[1]
@@ -1000,7 +1079,8 @@ async def cb_edit_field(callback: CallbackQuery, state: FSMContext):
         "expiry": ("📅", "дату оплаты (ДД.ММ.ГГГГ)"),
         "price": ("💰", "цену"),
         "notes": ("📋", "заметки"),
-        "tags": ("🏷", "теги")
+        "tags": ("🏷", "теги"),
+        "ports": ("🔌", "порты мониторинга через запятую\n(«-» — по умолчанию)")
     }
 
     emoji, name = field_names[field]
@@ -1016,7 +1096,7 @@ async def cb_edit_field(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(EditServerStates.waiting_value)
-async def process_edit_value(message: Message, state: FSMContext):
+async def process_edit_value(message: Message, state: FSMContext, monitoring: MonitoringService):
     data = await state.get_data()
     field = data['edit_field']
     server_id = data['edit_server_id']
@@ -1048,6 +1128,20 @@ async def process_edit_value(message: Message, state: FSMContext):
             )
             return
         update_data['price'] = price
+    elif field == "ports":
+        if value == "-":
+            update_data['monitoring_ports'] = None
+        else:
+            ports = parse_ports(value)
+            if ports is None:
+                await message.answer(
+                    "❌ Неверный формат\n\n"
+                    "Введите порты через запятую: <b>443, 8080</b>",
+                    reply_markup=get_cancel_keyboard(),
+                    parse_mode="HTML"
+                )
+                return
+            update_data['monitoring_ports'] = ",".join(str(p) for p in ports)
     else:
         update_data[field] = value
 
@@ -1056,6 +1150,7 @@ async def process_edit_value(message: Message, state: FSMContext):
     if success:
         await state.clear()
         server = await db.get_server(server_id, user_id)
+        monitoring.track(server)
         text = f"✅ <b>Обновлено!</b>\n\n{format_server_info(server, detailed=True)}"
         await message.answer(text, reply_markup=get_server_detail_keyboard(server), parse_mode="HTML")
     else:
@@ -1069,7 +1164,7 @@ async def process_edit_value(message: Message, state: FSMContext):
 # === Мониторинг ===
 
 @router.callback_query(F.data.startswith("toggle_monitoring_"))
-async def cb_toggle_monitoring(callback: CallbackQuery):
+async def cb_toggle_monitoring(callback: CallbackQuery, monitoring: MonitoringService):
     server_id = int(callback.data.split("_")[2])
     server = await db.get_server(server_id, callback.from_user.id)
 
@@ -1083,21 +1178,15 @@ async def cb_toggle_monitoring(callback: CallbackQuery):
 
     # При включении мониторинга проверяем безопасность IP/URL
     new_value = not server.is_monitoring
-    if new_value:
-        if server.url:
-            is_safe, error = is_safe_url(server.url)
-            if not is_safe:
-                await callback.answer(f"⚠️ URL небезопасен: {error}", show_alert=True)
-                return
-        if server.ip:
-            is_safe, error = is_safe_ip_for_monitoring(server.ip)
-            if not is_safe:
-                await callback.answer(f"⚠️ IP небезопасен: {error}", show_alert=True)
-                return
+    error = get_monitoring_error(server) if new_value else None
+    if error:
+        await callback.answer(error, show_alert=True)
+        return
 
     await db.update_server(server_id, callback.from_user.id, is_monitoring=new_value)
 
     server = await db.get_server(server_id, callback.from_user.id)
+    monitoring.track(server)
     text = format_server_info(server, detailed=True)
     await callback.message.edit_text(
         text,
@@ -1109,6 +1198,185 @@ async def cb_toggle_monitoring(callback: CallbackQuery):
     await callback.answer(f"📡 Мониторинг {status}")
 
 
+def get_monitoring_error(server: Server) -> Optional[str]:
+    """Причина, по которой мониторинг сервера нельзя включить, или None."""
+    if not server.ip and not server.url:
+        return "⚠️ Для мониторинга нужен IP или URL"
+    if server.url:
+        is_safe, error = is_safe_url(server.url)
+        if not is_safe:
+            return f"⚠️ URL небезопасен: {error}"
+    if server.ip:
+        is_safe, error = is_safe_ip_for_monitoring(server.ip)
+        if not is_safe:
+            return f"⚠️ IP небезопасен: {error}"
+    return None
+
+
+# === Массовые действия ===
+
+@router.callback_query(F.data == "bulk_start")
+async def cb_bulk_start(callback: CallbackQuery, state: FSMContext):
+    await state.update_data(bulk_ids=[])
+    await show_list_view(callback, state)
+    await callback.answer()
+
+
+@router.callback_query(F.data == "bulk_show")
+async def cb_bulk_show(callback: CallbackQuery, state: FSMContext):
+    await state.set_state(None)
+    await show_list_view(callback, state)
+    await callback.answer()
+
+
+@router.callback_query(F.data == "bulk_done")
+async def cb_bulk_done(callback: CallbackQuery, state: FSMContext):
+    await state.update_data(bulk_ids=None)
+    await show_list_view(callback, state)
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("bulk_pick_"))
+async def cb_bulk_pick(callback: CallbackQuery, state: FSMContext):
+    server_id = int(callback.data.split("_")[2])
+    data = await state.get_data()
+    selected = set(data.get('bulk_ids') or [])
+    selected ^= {server_id}
+    await state.update_data(bulk_ids=sorted(selected))
+    await show_list_view(callback, state)
+    await callback.answer()
+
+
+@router.callback_query(F.data.in_({"bulk_all", "bulk_none"}))
+async def cb_bulk_select_all(callback: CallbackQuery, state: FSMContext):
+    if callback.data == "bulk_all":
+        # Все серверы под текущим фильтром, а не только видимая страница
+        filters = get_list_filter(await state.get_data())
+        await state.update_data(bulk_ids=await db.get_filtered_server_ids(callback.from_user.id, filters))
+    else:
+        await state.update_data(bulk_ids=[])
+    await show_list_view(callback, state)
+    await callback.answer()
+
+
+async def get_bulk_ids(callback: CallbackQuery, state: FSMContext) -> list[int]:
+    """Выбранные серверы; если выбора нет, показывает подсказку."""
+    server_ids = (await state.get_data()).get('bulk_ids') or []
+    if not server_ids:
+        await callback.answer("Сначала отметьте серверы", show_alert=True)
+    return server_ids
+
+
+@router.callback_query(F.data == "bulk_paid")
+async def cb_bulk_paid(callback: CallbackQuery, state: FSMContext):
+    server_ids = await get_bulk_ids(callback, state)
+    if not server_ids:
+        return
+
+    servers = await db.mark_paid_many(server_ids, callback.from_user.id)
+    await state.update_data(bulk_ids=[])
+    await show_list_view(callback, state)
+    await callback.answer(f"✅ Оплата отмечена: {len(servers)}")
+
+
+@router.callback_query(F.data == "bulk_monitoring")
+async def cb_bulk_monitoring(callback: CallbackQuery, state: FSMContext, monitoring: MonitoringService):
+    """Включает мониторинг выбранным серверам, а если включать некому — выключает."""
+    server_ids = await get_bulk_ids(callback, state)
+    if not server_ids:
+        return
+
+    selected = set(server_ids)
+    servers = [s for s in await db.get_all_servers(callback.from_user.id) if s.id in selected]
+    eligible = [server for server in servers if get_monitoring_error(server) is None]
+    new_value = any(not server.is_monitoring for server in eligible)
+    if not new_value:
+        eligible = servers
+
+    updated = await db.update_servers([s.id for s in eligible], callback.from_user.id, is_monitoring=new_value)
+    for server in updated:
+        monitoring.track(server)
+
+    await state.update_data(bulk_ids=[])
+    await show_list_view(callback, state)
+
+    status = "🟢 включён" if new_value else "⚫ выключен"
+    text = f"📡 Мониторинг {status}: {len(updated)}"
+    skipped = len(servers) - len(eligible)
+    if skipped:
+        text += f"\nПропущено без IP/URL или с небезопасным адресом: {skipped}"
+    await callback.answer(text, show_alert=bool(skipped))
+
+
+@router.callback_query(F.data == "bulk_tags")
+async def cb_bulk_tags(callback: CallbackQuery, state: FSMContext):
+    server_ids = await get_bulk_ids(callback, state)
+    if not server_ids:
+        return
+
+    await state.set_state(BulkStates.tags)
+    await callback.message.edit_text(
+        f"🏷 Введите <b>теги</b> для выбранных серверов ({len(server_ids)}):\n"
+        f"<i>«-» — убрать теги</i>",
+        reply_markup=get_cancel_keyboard(),
+        parse_mode="HTML"
+    )
+    await callback.answer()
+
+
+@router.message(BulkStates.tags)
+async def process_bulk_tags(message: Message, state: FSMContext):
+    value = message.text.strip()
+    tags = None if value == "-" else sanitize_text(value, 200) or None
+
+    server_ids = (await state.get_data()).get('bulk_ids') or []
+    updated = await db.update_servers(server_ids, message.from_user.id, tags=tags)
+
+    await state.set_state(None)
+    await state.update_data(bulk_ids=[])
+    text, keyboard = await get_list_view(message.from_user.id, state)
+    await message.answer(
+        f"🏷 Теги обновлены: <b>{len(updated)}</b>\n\n{text}",
+        reply_markup=keyboard,
+        parse_mode="HTML"
+    )
+
+
+@router.callback_query(F.data == "bulk_delete")
+async def cb_bulk_delete(callback: CallbackQuery, state: FSMContext):
+    server_ids = await get_bulk_ids(callback, state)
+    if not server_ids:
+        return
+
+    selected = set(server_ids)
+    servers = [s for s in await db.get_all_servers(callback.from_user.id) if s.id in selected]
+    names = "\n".join(f"• {server.name}" for server in servers[:10])
+    if len(servers) > 10:
+        names += f"\n… и ещё {len(servers) - 10}"
+
+    await callback.message.edit_text(
+        f"🗑 <b>Удалить серверы ({len(servers)})?</b>\n\n{names}",
+        reply_markup=get_bulk_delete_confirm_keyboard(),
+        parse_mode="HTML"
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data == "bulk_delete_confirm")
+async def cb_bulk_delete_confirm(callback: CallbackQuery, state: FSMContext, monitoring: MonitoringService):
+    server_ids = await get_bulk_ids(callback, state)
+    if not server_ids:
+        return
+
+    deleted = await db.delete_servers(server_ids, callback.from_user.id)
+    for server_id in deleted:
+        monitoring.untrack(server_id)
+
+    await state.update_data(bulk_ids=[])
+    await show_list_view(callback, state)
+    await callback.answer(f"🗑 Удалено: {len(deleted)}")
+
+
 # === Истекающие серверы ===
 
 @router.message(Command("expiring"))
@@ -1131,29 +1399,20 @@ async def cb_expiring_servers(callback: CallbackQuery):
 @router.message(Command("settings"))
 async def cmd_settings(message: Message):
     settings = await db.get_settings(message.from_user.id)
-    text = (
-        f"⚙️ <b>Настройки</b>\n"
-        f"━━━━━━━━━━━━━━━━━━━━\n\n"
-        f"🔔 Напоминать за <b>{settings.reminder_days}</b> дней\n"
-        f"до окончания оплаты\n\n"
-        f"Выберите новое значение:"
+    await message.answer(
+        format_settings(settings),
+        reply_markup=get_settings_keyboard(settings.reminder_days, settings.reminder_time),
+        parse_mode="HTML"
     )
-    await message.answer(text, reply_markup=get_settings_keyboard(settings.reminder_days), parse_mode="HTML")
 
 
 @router.callback_query(F.data == "settings")
-async def cb_settings(callback: CallbackQuery):
+async def cb_settings(callback: CallbackQuery, state: FSMContext):
+    await state.clear()
     settings = await db.get_settings(callback.from_user.id)
-    text = (
-        f"⚙️ <b>Настройки</b>\n"
-        f"━━━━━━━━━━━━━━━━━━━━\n\n"
-        f"🔔 Напоминать за <b>{settings.reminder_days}</b> дней\n"
-        f"до окончания оплаты\n\n"
-        f"Выберите новое значение:"
-    )
     await callback.message.edit_text(
-        text,
-        reply_markup=get_settings_keyboard(settings.reminder_days),
+        format_settings(settings),
+        reply_markup=get_settings_keyboard(settings.reminder_days, settings.reminder_time),
         parse_mode="HTML"
     )
     await callback.answer()
@@ -1164,21 +1423,96 @@ async def cb_set_reminder_days(callback: CallbackQuery):
     days = int(callback.data.split("_")[2])
     await db.update_settings(callback.from_user.id, reminder_days=days)
 
-    text = (
-        f"⚙️ <b>Настройки</b>\n"
-        f"━━━━━━━━━━━━━━━━━━━━\n\n"
-        f"🔔 Напоминать за <b>{days}</b> дней\n"
-        f"до окончания оплаты\n\n"
-        f"Выберите новое значение:"
-    )
+    settings = await db.get_settings(callback.from_user.id)
     await callback.message.edit_text(
-        text,
-        reply_markup=get_settings_keyboard(days),
+        format_settings(settings),
+        reply_markup=get_settings_keyboard(settings.reminder_days, settings.reminder_time),
         parse_mode="HTML"
     )
     await callback.answer(f"✅ Установлено: {days} дней")
 
 
+@router.callback_query(F.data.regexp(r"^set_time_\d{4}$"))
+async def cb_set_reminder_time(callback: CallbackQuery):
+    raw = callback.data.split("_")[2]
+    reminder_time = f"{raw[:2]}:{raw[2:]}"
+    await db.update_settings(callback.from_user.id, reminder_time=reminder_time)
+
+    settings = await db.get_settings(callback.from_user.id)
+    await callback.message.edit_text(
+        format_settings(settings),
+        reply_markup=get_settings_keyboard(settings.reminder_days, settings.reminder_time),
+        parse_mode="HTML"
+    )
+    await callback.answer(f"✅ Напоминания в {reminder_time}")
+
+
+@router.callback_query(F.data == "settings_time")
+async def cb_settings_time(callback: CallbackQuery, state: FSMContext):
+    await state.set_state(SettingsStates.reminder_time)
+    await callback.message.edit_text(
+        "🕐 Введите время напоминаний в формате <b>ЧЧ:ММ</b>\n"
+        "Например: <code>09:30</code>",
+        reply_markup=get_cancel_keyboard(),
+        parse_mode="HTML"
+    )
+    await callback.answer()
+
+
+@router.message(SettingsStates.reminder_time)
+async def process_reminder_time(message: Message, state: FSMContext):
+    reminder_time = parse_reminder_time(message.text or "")
+    if not reminder_time:
+        await message.answer(
+            "❌ Неверный формат. Введите время как <code>09:30</code>",
+            reply_markup=get_cancel_keyboard(),
+            parse_mode="HTML"
+        )
+        return
+
+    await state.clear()
+    await db.update_settings(message.from_user.id, reminder_time=reminder_time)
+    settings = await db.get_settings(message.from_user.id)
+    await message.answer(
+        format_settings(settings),
+        reply_markup=get_settings_keyboard(settings.reminder_days, settings.reminder_time),
+        parse_mode="HTML"
+    )
+
+
+@router.callback_query(F.data == "settings_tz")
+async def cb_settings_tz(callback: CallbackQuery, state: FSMContext):
+    await state.set_state(SettingsStates.timezone)
+    await callback.message.edit_text(
+        "🌍 Введите часовой пояс\n"
+        "Например: <code>Europe/Moscow</code>, <code>Asia/Yekaterinburg</code>, <code>UTC</code>",
+        reply_markup=get_cancel_keyboard(),
+        parse_mode="HTML"
+    )
+    await callback.answer()
+
+
+@router.message(SettingsStates.timezone)
+async def process_timezone(message: Message, state: FSMContext):
+    timezone = parse_timezone(message.text or "")
+    if not timezone:
+        await message.answer(
+            "❌ Неизвестный часовой пояс. Пример: <code>Europe/Moscow</code>",
+            reply_markup=get_cancel_keyboard(),
+            parse_mode="HTML"
+        )
+        return
+
+    await state.clear()
+    await db.update_settings(message.from_user.id, timezone=timezone)
+    settings = await db.get_settings(message.from_user.id)
+    await message.answer(
+        format_settings(settings),
+        reply_markup=get_settings_keyboard(settings.reminder_days, settings.reminder_time),
+        parse_mode="HTML"
+    )
+
+
 @router.callback_query(F.data == "current_days")
 async def cb_current_days(callback: CallbackQuery):
     await callback.answer()
@@ -4,21 +4,38 @@ from aiogram.filters import Command
 
 from database import db
 from keyboards import get_back_keyboard
-from utils import format_stats
+from utils import format_stats, format_uptime
 
 router = Router()
 
 
 @router.message(Command("stats"))
 async def cmd_stats(message: Message):
-    servers = await db.get_all_servers(message.from_user.id)
-    text = format_stats(servers)
+    aggregates = await db.get_spend_aggregates(message.from_user.id)
+    text = format_stats(aggregates)
     await message.answer(text, reply_markup=get_back_keyboard(), parse_mode="HTML")
 
 
 @router.callback_query(F.data == "stats")
 async def cb_stats(callback: CallbackQuery):
+    aggregates = await db.get_spend_aggregates(callback.from_user.id)
+    text = format_stats(aggregates)
+    await callback.message.edit_text(text, reply_markup=get_back_keyboard(), parse_mode="HTML")
+    await callback.answer()
+
+
+@router.message(Command("uptime"))
+async def cmd_uptime(message: Message):
+    servers = await db.get_all_servers(message.from_user.id)
+    summaries = await db.get_uptime_summaries(message.from_user.id)
+    text = format_uptime(servers, summaries)
+    await message.answer(text, reply_markup=get_back_keyboard(), parse_mode="HTML")
+
+
+@router.callback_query(F.data == "uptime")
+async def cb_uptime(callback: CallbackQuery):
     servers = await db.get_all_servers(callback.from_user.id)
-    text = format_stats(servers)
+    summaries = await db.get_uptime_summaries(callback.from_user.id)
+    text = format_uptime(servers, summaries)
     await callback.message.edit_text(text, reply_markup=get_back_keyboard(), parse_mode="HTML")
     await callback.answer()
@@ -1,7 +1,8 @@
 from datetime import date
+from typing import Optional
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from database import Server
+from database import Server, ServerFilter, ServerPage, UserFacets
 
 
 def get_status_emoji(days_left: int) -> str:
@@ -32,6 +33,7 @@ def get_main_menu() -> InlineKeyboardMarkup:
         InlineKeyboardButton(text="🔗 Интеграции", callback_data="hosting_menu")
     )
     builder.row(
+        InlineKeyboardButton(text="📡 Аптайм", callback_data="uptime"),
         InlineKeyboardButton(text="⚙️ Настройки", callback_data="settings")
     )
     return builder.as_markup()
@@ -119,6 +121,9 @@ def get_edit_server_keyboard(server_id: int) -> InlineKeyboardMarkup:
     )
     builder.row(
         InlineKeyboardButton(text="🏷 Теги", callback_data=f"edit_tags_{server_id}"),
+        InlineKeyboardButton(text="🔌 Порты", callback_data=f"edit_ports_{server_id}")
+    )
+    builder.row(
         InlineKeyboardButton(text="◀️ Назад", callback_data=f"server_{server_id}")
     )
     return builder.as_markup()
@@ -167,7 +172,7 @@ def get_skip_keyboard(field: str) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
-def get_settings_keyboard(reminder_days: int) -> InlineKeyboardMarkup:
+def get_settings_keyboard(reminder_days: int, reminder_time: str = "10:00") -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     builder.row(
         InlineKeyboardButton(text=f"🔔 Сейчас: {reminder_days} дней", callback_data="current_days")
@@ -181,6 +186,17 @@ def get_settings_keyboard(reminder_days: int) -> InlineKeyboardMarkup:
         InlineKeyboardButton(text="🔟", callback_data="set_days_10"),
         InlineKeyboardButton(text="1️⃣4️⃣", callback_data="set_days_14")
     )
+    builder.row(*[
+        InlineKeyboardButton(
+            text=f"✓ {t}" if t == reminder_time else t,
+            callback_data=f"set_time_{t.replace(':', '')}"
+        )
+        for t in ("08:00", "10:00", "12:00", "18:00", "21:00")
+    ])
+    builder.row(
+        InlineKeyboardButton(text="🕐 Своё время", callback_data="settings_time"),
+        InlineKeyboardButton(text="🌍 Часовой пояс", callback_data="settings_tz")
+    )
     builder.row(
         InlineKeyboardButton(text="🏠 Меню", callback_data="main_menu")
     )
@@ -305,27 +321,35 @@ def get_payment_change_keyboard(server_id: int) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
-def get_server_list_keyboard_with_sort(servers: list[Server], current_sort: str = "date") -> InlineKeyboardMarkup:
-    """Клавиатура списка серверов с сортировкой."""
-    builder = InlineKeyboardBuilder()
+def get_server_list_keyboard_with_sort(
+    page: ServerPage,
+    current_sort: str = "date",
+    selected: Optional[set[int]] = None,
+    active_filters: int = 0
+) -> InlineKeyboardMarkup:
+    """Клавиатура страницы списка серверов с сортировкой, фильтром и листанием.
 
-    # Сортируем серверы
-    if current_sort == "hosting":
-        sorted_servers = sorted(servers, key=lambda s: (s.hosting.lower(), (s.expiry_date - date.today()).days))
-    elif current_sort == "location":
-        sorted_servers = sorted(servers, key=lambda s: ((s.location or "zzz").lower(), (s.expiry_date - date.today()).days))
-    else:  # date
-        sorted_servers = sorted(servers, key=lambda s: (s.expiry_date - date.today()).days)
+    selected — режим выбора нескольких серверов: кнопки серверов отмечают
+    выбор, внизу — массовые действия.
+    """
+    builder = InlineKeyboardBuilder()
 
     # Кнопки серверов - по 2 в ряд для компактности
     buttons = []
-    for server in sorted_servers:
+    for server in page.servers:
         days_left = (server.expiry_date - date.today()).days
         status = get_status_emoji(days_left)
 
         # Короткое имя для кнопки (макс ~15 символов)
         name = server.name[:12] + "…" if len(server.name) > 12 else server.name
 
+        if selected is not None:
+            mark = "✅" if server.id in selected else "▫️"
+            buttons.append(
+                InlineKeyboardButton(text=f"{mark} {name}", callback_data=f"bulk_pick_{server.id}")
+            )
+            continue
+
         buttons.append(
             InlineKeyboardButton(
                 text=f"{status} {name}",
@@ -340,6 +364,33 @@ def get_server_list_keyboard_with_sort(servers: list[Server], current_sort: str
         else:
             builder.row(buttons[i])
 
+    # Листание: кнопки несут курсор — id крайнего сервера страницы
+    nav = []
+    if page.has_prev and page.servers:
+        nav.append(InlineKeyboardButton(text="◀️", callback_data=f"page_b_{page.servers[0].id}"))
+    if page.has_next and page.servers:
+        nav.append(InlineKeyboardButton(text="▶️", callback_data=f"page_a_{page.servers[-1].id}"))
+    if nav:
+        builder.row(*nav)
+
+    if selected is not None:
+        builder.row(
+            InlineKeyboardButton(text="☑️ Все", callback_data="bulk_all"),
+            InlineKeyboardButton(text="▫️ Снять выбор", callback_data="bulk_none")
+        )
+        builder.row(
+            InlineKeyboardButton(text="💳 Оплачено", callback_data="bulk_paid"),
+            InlineKeyboardButton(text="📡 Мониторинг", callback_data="bulk_monitoring")
+        )
+        builder.row(
+            InlineKeyboardButton(text="🏷 Теги", callback_data="bulk_tags"),
+            InlineKeyboardButton(text="🗑 Удалить", callback_data="bulk_delete")
+        )
+        builder.row(
+            InlineKeyboardButton(text="↩️ Готово", callback_data="bulk_done")
+        )
+        return builder.as_markup()
+
     # Кнопки сортировки
     date_text = "✓ Дата" if current_sort == "date" else "Дата"
     hosting_text = "✓ Хостинг" if current_sort == "hosting" else "Хостинг"
@@ -351,8 +402,64 @@ def get_server_list_keyboard_with_sort(servers: list[Server], current_sort: str
         InlineKeyboardButton(text=location_text, callback_data="sort_location")
     )
 
+    filter_text = f"🔎 Фильтр ({active_filters})" if active_filters else "🔎 Фильтр"
+    if page.servers:
+        builder.row(
+            InlineKeyboardButton(text=filter_text, callback_data="filters"),
+            InlineKeyboardButton(text="☑️ Выбрать несколько", callback_data="bulk_start")
+        )
+    else:
+        builder.row(InlineKeyboardButton(text=filter_text, callback_data="filters"))
     builder.row(
         InlineKeyboardButton(text="➕ Добавить", callback_data="add_server"),
         InlineKeyboardButton(text="🏠 Меню", callback_data="main_menu")
     )
     return builder.as_markup()
+
+
+# Сколько значений каждого вида показывать в фильтре
+_FILTER_CHIPS = 8
+_FILTER_DUE_DAYS = (-1, 3, 7, 30)  # -1 — только просроченные
+
+
+def get_filter_keyboard(facets: UserFacets, filters: ServerFilter) -> InlineKeyboardMarkup:
+    """Клавиатура фильтра списка: повторное нажатие снимает условие.
+
+    Кнопки хостингов, локаций и тегов ссылаются на номер значения в facets,
+    чтобы не упираться в лимит callback_data.
+    """
+    builder = InlineKeyboardBuilder()
+
+    def chip(text: str, active: bool, callback_data: str) -> InlineKeyboardButton:
+        return InlineKeyboardButton(text=f"✓ {text}" if active else text, callback_data=callback_data)
+
+    builder.row(*[
+        chip("❗ Просрочены" if days < 0 else f"≤{days} дн.", filters.due_days == days, f"flt_d_{days}")
+        for days in _FILTER_DUE_DAYS
+    ])
+
+    chips = (
+        [chip(f"🏢 {value}", value == filters.hosting, f"flt_h_{i}")
+         for i, value in enumerate(facets.hostings[:_FILTER_CHIPS])]
+        + [chip(f"📍 {value}", value == filters.location, f"flt_l_{i}")
+           for i, value in enumerate(facets.locations[:_FILTER_CHIPS])]
+        + [chip(f"🏷 {value}", value == filters.tag, f"flt_t_{i}")
+           for i, value in enumerate(facets.tags[:_FILTER_CHIPS])]
+    )
+    for i in range(0, len(chips), 2):
+        builder.row(*chips[i:i + 2])
+
+    builder.row(
+        InlineKeyboardButton(text="✖️ Сбросить", callback_data="flt_reset"),
+        InlineKeyboardButton(text="◀️ К списку", callback_data="flt_done")
+    )
+    return builder.as_markup()
+
+
+def get_bulk_delete_confirm_keyboard() -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    builder.row(
+        InlineKeyboardButton(text="🗑 Да, удалить", callback_data="bulk_delete_confirm"),
+        InlineKeyboardButton(text="↩️ Отмена", callback_data="bulk_show")
+    )
+    return builder.as_markup()
@@ -1,4 +1,6 @@
 from .scheduler import setup_scheduler
 from .monitoring import MonitoringService
+from .delivery import DeliveryService
+from .outbox import OutboxDrainer
 
-__all__ = ["setup_scheduler", "MonitoringService"]
+__all__ = ["setup_scheduler", "MonitoringService", "DeliveryService", "OutboxDrainer"]
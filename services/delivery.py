@@ -0,0 +1,237 @@
+import logging
+import asyncio
+import heapq
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+)
+
+from config import (
+    DELIVERY_GLOBAL_RATE, DELIVERY_CHAT_INTERVAL_MS,
+    DELIVERY_MAX_ATTEMPTS, DELIVERY_DRAIN_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+# Очереди по приоритету: меньше — раньше
+PRIORITY_ALERT = 0
+PRIORITY_REMINDER = 1
+
+# Итог доставки, которым завершается future из send()
+DELIVERED = "delivered"
+# Не доставлено сейчас (сеть, флуд-контроль, остановка) — можно повторить позже
+DEFERRED = "deferred"
+# Telegram отверг сообщение (бот заблокирован, чат недоступен) — повтор не поможет
+REJECTED = "rejected"
+
+# Сколько раз сообщение откладывается по TelegramRetryAfter, прежде чем
+# вернуться вызывающему как DEFERRED
+_MAX_FLOOD_DEFERRALS = 3
+
+
+@dataclass
+class _Message:
+    chat_id: int
+    text: str
+    kwargs: Dict[str, Any]
+    priority: int
+    future: asyncio.Future
+    attempts: int = 0
+    deferrals: int = 0
+
+
+@dataclass(order=True)
+class _Entry:
+    """Запись очереди; seq сохраняет порядок сообщений одного приоритета."""
+    priority: int
+    seq: int
+    message: _Message = field(compare=False)
+
+
+class _TokenBucket:
+    """Глобальный лимит отправки: rate сообщений в секунду с запасом на всплеск."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class DeliveryService:
+    """Единая очередь исходящих сообщений.
+
+    Соблюдает лимиты Telegram: общий темп DELIVERY_GLOBAL_RATE сообщений
+    в секунду и не чаще одного сообщения в DELIVERY_CHAT_INTERVAL_MS на чат.
+    Уведомления мониторинга обгоняют напоминания, TelegramRetryAfter
+    откладывает сообщение на указанное время вместо потери.
+    """
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.running = False
+        self._task = None
+        self._bucket = _TokenBucket(DELIVERY_GLOBAL_RATE)
+        self._chat_interval = DELIVERY_CHAT_INTERVAL_MS / 1000
+        self._seq = itertools.count()
+
+        # Готовые к отправке и отложенные (not_before, запись) сообщения
+        self._ready: list[_Entry] = []
+        self._delayed: list[tuple[float, _Entry]] = []
+        # Когда можно писать в чат в следующий раз
+        self._chat_free_at: Dict[int, float] = {}
+        self._wakeup = asyncio.Event()
+        self._sending: set[asyncio.Task] = set()
+
+    async def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._task = asyncio.create_task(self._delivery_loop())
+        logger.info("Delivery service started")
+
+    async def stop(self):
+        """Дожидается отправки очереди не дольше DELIVERY_DRAIN_SECONDS и останавливается."""
+        if not self.running:
+            return
+        deadline = time.monotonic() + DELIVERY_DRAIN_SECONDS
+        while (self._ready or self._delayed or self._sending) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        self.running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        for task in self._sending:
+            task.cancel()
+        await asyncio.gather(*self._sending, return_exceptions=True)
+
+        dropped = 0
+        for entry in self._ready + [entry for _, entry in self._delayed]:
+            if not entry.message.future.done():
+                entry.message.future.set_result(DEFERRED)
+            dropped += 1
+        self._ready.clear()
+        self._delayed.clear()
+        if dropped:
+            logger.warning(f"Delivery service stopped with {dropped} undelivered messages")
+        logger.info("Delivery service stopped")
+
+    def send(
+        self,
+        chat_id: int,
+        text: str,
+        priority: int = PRIORITY_ALERT,
+        **kwargs
+    ) -> asyncio.Future:
+        """Ставит сообщение в очередь.
+
+        Возвращает future с итогом доставки: DELIVERED, DEFERRED или REJECTED.
+        Ждать его не обязательно.
+        """
+        future = asyncio.get_running_loop().create_future()
+        message = _Message(chat_id=chat_id, text=text, kwargs=kwargs, priority=priority, future=future)
+        heapq.heappush(self._ready, _Entry(priority, next(self._seq), message))
+        self._wakeup.set()
+        return future
+
+    def stats(self) -> dict:
+        return {
+            "ready": len(self._ready),
+            "delayed": len(self._delayed),
+            "sending": len(self._sending),
+        }
+
+    async def _delivery_loop(self):
+        while self.running:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, entry = heapq.heappop(self._delayed)
+                heapq.heappush(self._ready, entry)
+
+            if not self._ready:
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            entry = heapq.heappop(self._ready)
+            chat_id = entry.message.chat_id
+            free_at = self._chat_free_at.get(chat_id, 0.0)
+            if free_at > now:
+                # Чат ещё на паузе — остальные чаты не ждут
+                heapq.heappush(self._delayed, (free_at, entry))
+                continue
+
+            await self._bucket.acquire()
+            self._chat_free_at[chat_id] = time.monotonic() + self._chat_interval
+            if len(self._chat_free_at) > 10000:
+                self._forget_idle_chats()
+
+            task = asyncio.create_task(self._deliver(entry))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    def _forget_idle_chats(self):
+        now = time.monotonic()
+        for chat_id in [c for c, free_at in self._chat_free_at.items() if free_at <= now]:
+            del self._chat_free_at[chat_id]
+
+    def _defer(self, entry: _Entry, delay: float):
+        heapq.heappush(self._delayed, (time.monotonic() + delay, entry))
+        self._wakeup.set()
+
+    async def _deliver(self, entry: _Entry):
+        message = entry.message
+        message.attempts += 1
+        try:
+            await self.bot.send_message(message.chat_id, message.text, **message.kwargs)
+            message.future.set_result(DELIVERED)
+        except asyncio.CancelledError:
+            if not message.future.done():
+                message.future.set_result(DEFERRED)
+            raise
+        except TelegramRetryAfter as e:
+            # Флуд-контроль: пауза относится к чату, попытка не расходуется,
+            # но число откладываний ограничено, чтобы вызывающий не ждал бесконечно
+            message.attempts -= 1
+            message.deferrals += 1
+            self._chat_free_at[message.chat_id] = time.monotonic() + e.retry_after
+            if message.deferrals > _MAX_FLOOD_DEFERRALS:
+                message.future.set_result(DEFERRED)
+                logger.warning(f"Flood control for chat {message.chat_id}, giving up for now")
+                return
+            self._defer(entry, e.retry_after)
+            logger.warning(f"Flood control for chat {message.chat_id}, retry in {e.retry_after}s")
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Бот заблокирован или чат недоступен — повтор не поможет
+            message.future.set_result(REJECTED)
+            logger.error(f"Failed to send message to {message.chat_id}: {e}")
+        except Exception as e:
+            if message.attempts >= DELIVERY_MAX_ATTEMPTS:
+                message.future.set_result(DEFERRED)
+                logger.error(f"Failed to send message to {message.chat_id} after {message.attempts} attempts: {e}")
+            else:
+                self._defer(entry, 2 ** (message.attempts - 1))
+                logger.warning(f"Failed to send message to {message.chat_id}, retrying: {e}")
@@ -1,30 +1,136 @@
 import logging
 import asyncio
-from typing import Dict
+import heapq
+import random
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, Optional
+from urllib.parse import urlsplit, urlunsplit
 
 import aiohttp
-from aiogram import Bot
-
-from database import db, Server
-from config import MONITORING_INTERVAL_MINUTES, MONITORING_TIMEOUT_SECONDS
+from database import db, Server, MonitorCheck, MonitorState, UptimeRollup, OutboxMessage
+from config import (
+    MONITORING_INTERVAL_MINUTES, MONITORING_TIMEOUT_SECONDS,
+    MONITORING_MAX_CONCURRENCY, MONITORING_MAX_PER_USER,
+    MONITORING_HTTP_PER_HOST, MONITORING_DNS_CACHE_SECONDS,
+    MONITORING_DEFAULT_PORTS, MONITORING_PORT_STAGGER_MS, MONITORING_SYNC_MINUTES,
+    MONITORING_FLUSH_SECONDS, MONITORING_FLUSH_BATCH, MONITORING_HISTORY_DAYS,
+    MONITORING_HOURLY_RETENTION_DAYS, MONITORING_DAILY_RETENTION_DAYS,
+    MONITORING_CONFIRM_N, MONITORING_CONFIRM_M, MONITORING_REPROBE_SECONDS
+)
 from security import is_safe_url, is_safe_ip_for_monitoring
+from utils import parse_ports
+from services.outbox import OutboxDrainer
 
 logger = logging.getLogger(__name__)
 
+# Сколько часов проверок держать в памяти для часовых агрегатов
+_SAMPLE_HOURS = 2
+
+# Замер: время проверки (UTC), задержка в мс или None, доступен ли
+_Sample = tuple[datetime, Optional[float], bool]
+
+
+# Нормализованный адрес проверки: ("url", канонический URL) или ("ip", IP, порты)
+_TargetKey = tuple
+
+
+@dataclass
+class _Target:
+    """Цель мониторинга в расписании: один адрес, общий для всех подписанных серверов."""
+    key: _TargetKey
+    interval: float
+    due: float
+    seq: int  # совпадает с записью в куче, если та актуальна
+    regular_due: float = 0.0  # плановый запуск; due может быть раньше из-за перепроверки
+    servers: Dict[int, Server] = field(default_factory=dict)
+    ports: list[int] = field(default_factory=list)
+    last_port: Optional[int] = None
+    in_flight: bool = False
+
+    # Подтверждение смены статуса: N одинаковых результатов из последних M
+    confirmed: Optional[bool] = None
+    recent: Deque[bool] = field(default_factory=lambda: deque(maxlen=MONITORING_CONFIRM_M))
+    retries: int = 0  # перепроверок подряд, пока смена не подтверждена
+
+    def observe(self, is_online: bool) -> bool:
+        """Учитывает результат проверки, возвращает True, если нужна перепроверка."""
+        if self.confirmed is None:
+            self.confirmed = is_online
+            return False
+
+        self.recent.append(is_online)
+        if is_online == self.confirmed:
+            self.retries = 0
+            return False
+
+        if sum(1 for result in self.recent if result == is_online) >= MONITORING_CONFIRM_N:
+            # Смена подтверждена, окно начинается заново
+            self.confirmed = is_online
+            self.recent.clear()
+            self.retries = 0
+            return False
+
+        self.retries += 1
+        return True
+
 
 class MonitoringService:
-    def __init__(self, bot: Bot):
-        self.bot = bot
-        self.server_status: Dict[int, bool] = {}  # server_id -> is_online
+    def __init__(self, outbox: OutboxDrainer):
+        self.outbox = outbox
+        # Статусы только отслеживаемых серверов; восстанавливаются из базы при старте
+        self.states: Dict[int, MonitorState] = {}
         self.running = False
         self._task = None
+        self._flush_task = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._global_limit = asyncio.Semaphore(MONITORING_MAX_CONCURRENCY)
+        self._user_limits: Dict[int, asyncio.Semaphore] = {}
+
+        # Расписание: min-куча (due, seq, key). Удалённые и перенесённые
+        # цели не вычищаются из кучи, а отбрасываются при извлечении по seq.
+        # Серверы с одинаковым адресом подписаны на одну цель и проверяются
+        # одним запросом
+        self._targets: Dict[_TargetKey, _Target] = {}
+        self._subscriptions: Dict[int, _TargetKey] = {}
+        self._heap: list[tuple[float, int, _TargetKey]] = []
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._checks: set[asyncio.Task] = set()
+
+        # Накопленные для записи в базу результаты
+        self._pending_checks: list[MonitorCheck] = []
+        self._dirty_states: Dict[int, MonitorState] = {}
+        self._flush_now = asyncio.Event()
+
+        # Кольцевые буферы последних замеров по серверам и граница,
+        # до которой часовые агрегаты уже посчитаны
+        self._samples: Dict[int, Deque[_Sample]] = {}
+        self._rolled_until: Optional[datetime] = None
+
+        # Уведомления о смене статуса пишутся в outbox вместе со статусом
+        self._pending_alerts: list[OutboxMessage] = []
+
+        # Статистика между синхронизациями
+        self._checks_done = 0
+        self._max_lag = 0.0
 
     async def start(self):
         """Запускает мониторинг."""
         if self.running:
             return
         self.running = True
+        self._session = self._create_session()
+        try:
+            self.states = await db.get_monitor_states()
+        except Exception as e:
+            logger.error(f"Failed to restore monitoring state: {e}")
+        await self._restore_samples()
         self._task = asyncio.create_task(self._monitoring_loop())
+        self._flush_task = asyncio.create_task(self._flush_loop())
         logger.info("Monitoring service started")
 
     async def stop(self):
@@ -36,107 +142,518 @@ class MonitoringService:
                 await self._task
             except asyncio.CancelledError:
                 pass
+        for task in self._checks:
+            task.cancel()
+        await asyncio.gather(*self._checks, return_exceptions=True)
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        if self._session:
+            await self._session.close()
+            self._session = None
         logger.info("Monitoring service stopped")
 
+    def _create_session(self) -> aiohttp.ClientSession:
+        """Общая HTTP-сессия для всех проверок URL.
+
+        Пул соединений и DNS-кэш переживают циклы, поэтому повторные
+        проверки тех же хостов обходятся без лишних рукопожатий.
+        """
+        connector = aiohttp.TCPConnector(
+            limit=MONITORING_MAX_CONCURRENCY,
+            limit_per_host=MONITORING_HTTP_PER_HOST,
+            ttl_dns_cache=MONITORING_DNS_CACHE_SECONDS,
+            # Держим соединения дольше интервала, чтобы следующая проверка их застала
+            keepalive_timeout=MONITORING_INTERVAL_MINUTES * 60 + 30
+        )
+        timeout = aiohttp.ClientTimeout(total=MONITORING_TIMEOUT_SECONDS)
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    # === Расписание ===
+
+    def track(self, server: Server):
+        """Подписывает сервер на цель его адреса или обновляет его данные, O(log n).
+
+        Сервер без мониторинга или без IP/URL убирается из расписания.
+        """
+        if not server.is_monitoring or not (server.ip or server.url):
+            self.untrack(server.id)
+            return
+
+        key = _target_key(server)
+        old_key = self._subscriptions.get(server.id)
+        if old_key == key:
+            self._targets[key].servers[server.id] = server
+            return
+        if old_key is not None:
+            # Другой адрес — прошлый статус к нему не относится
+            self.untrack(server.id)
+
+        target = self._targets.get(key)
+        if target is None:
+            interval = MONITORING_INTERVAL_MINUTES * 60
+            # Первый запуск размазан по интервалу, чтобы проверки не шли одной пачкой
+            due = time.monotonic() + random.uniform(0, interval)
+            target = _Target(
+                key=key,
+                interval=interval,
+                due=due,
+                seq=0,
+                regular_due=due,
+                ports=parse_ports(server.monitoring_ports or "") or list(MONITORING_DEFAULT_PORTS)
+            )
+            self._targets[key] = target
+            self._push(target)
+            self._wakeup.set()
+
+        target.servers[server.id] = server
+        self._subscriptions[server.id] = key
+        state = self.states.get(server.id)
+        if state:
+            if target.confirmed is None:
+                target.confirmed = state.is_online
+            if target.last_port is None and state.last_port in target.ports:
+                target.last_port = state.last_port
+
+    def untrack(self, server_id: int):
+        """Отписывает сервер, O(1); цель без подписчиков удаляется, запись в куче станет неактуальной."""
+        key = self._subscriptions.pop(server_id, None)
+        if key is not None:
+            target = self._targets[key]
+            target.servers.pop(server_id, None)
+            if not target.servers:
+                del self._targets[key]
+        self.states.pop(server_id, None)
+        self._dirty_states.pop(server_id, None)
+        self._samples.pop(server_id, None)
+
+    async def sync(self):
+        """Сверяет расписание с базой: подхватывает изменения, сделанные в обход track()."""
+        servers = await db.get_servers_for_monitoring()
+        server_ids = {server.id for server in servers}
+
+        for server_id in list(self._subscriptions):
+            if server_id not in server_ids:
+                self.untrack(server_id)
+        # Восстановленные статусы серверов, которых больше нет в мониторинге
+        for server_id in list(self.states):
+            if server_id not in server_ids:
+                del self.states[server_id]
+        for server_id in list(self._samples):
+            if server_id not in server_ids:
+                del self._samples[server_id]
+        for server in servers:
+            self.track(server)
+
+        await db.prune_monitor_history(
+            MONITORING_HISTORY_DAYS,
+            MONITORING_HOURLY_RETENTION_DAYS,
+            MONITORING_DAILY_RETENTION_DAYS
+        )
+
+        # Лимиты пользователей, у которых больше нет серверов, не нужны
+        user_ids = {server.user_id for server in servers}
+        for user_id in list(self._user_limits):
+            if user_id not in user_ids:
+                del self._user_limits[user_id]
+
+        logger.info(
+            f"Monitoring: {len(self._targets)} targets for {len(self._subscriptions)} servers, "
+            f"{self._checks_done} checks "
+            f"since last sync, max start lag {self._max_lag:.1f}s"
+        )
+        if self._max_lag > MONITORING_TIMEOUT_SECONDS:
+            logger.warning(
+                f"Monitoring checks start up to {self._max_lag:.1f}s late, "
+                f"consider raising MONITORING_MAX_CONCURRENCY"
+            )
+        self._checks_done = 0
+        self._max_lag = 0.0
+
+    def _push(self, target: _Target):
+        self._seq += 1
+        target.seq = self._seq
+        heapq.heappush(self._heap, (target.due, target.seq, target.key))
+
+    def _pop_due(self, now: float) -> list[_Target]:
+        """Извлекает цели, время которых пришло, и сразу ставит их следующий запуск."""
+        due_targets = []
+        while self._heap and self._heap[0][0] <= now:
+            due, seq, key = heapq.heappop(self._heap)
+            target = self._targets.get(key)
+            if target is None or target.seq != seq:
+                continue  # удалена или перенесена
+
+            self._max_lag = max(self._max_lag, now - due)
+            # Следующий запуск считается от планового времени, а не от факта,
+            # поэтому период не «плывёт» на длительность проверки.
+            # Пропущенные из-за перегрузки запуски не копятся.
+            # После внеочередной перепроверки плановое время не сдвигается
+            if target.regular_due <= now:
+                skipped = int((now - target.regular_due) // target.interval) + 1
+                target.regular_due += skipped * target.interval
+            target.due = target.regular_due
+            self._push(target)
+
+            if not target.in_flight:
+                due_targets.append(target)
+        return due_targets
+
     async def _monitoring_loop(self):
-        """Основной цикл мониторинга."""
+        """Основной цикл: будит проверки по мере наступления их времени."""
+        sync_interval = MONITORING_SYNC_MINUTES * 60
+        next_sync = 0.0
+
         while self.running:
+            now = time.monotonic()
+            if now >= next_sync:
+                try:
+                    await self.sync()
+                except Exception as e:
+                    logger.error(f"Error syncing monitoring targets: {e}")
+                next_sync = now + sync_interval
+
+            for target in self._pop_due(now):
+                target.in_flight = True
+                task = asyncio.create_task(self._run_check(target))
+                self._checks.add(task)
+                task.add_done_callback(self._checks.discard)
+
+            timeout = next_sync - time.monotonic()
+            if self._heap:
+                timeout = min(timeout, self._heap[0][0] - time.monotonic())
+            self._wakeup.clear()
             try:
-                await self._check_all_servers()
+                await asyncio.wait_for(self._wakeup.wait(), max(0.0, timeout))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run_check(self, target: _Target):
+        """Проверяет цель и раздаёт результат всем подписанным серверам.
+
+        Единичный сбой не меняет статус: цель становится подозрительной и
+        перепроверяется с нарастающей паузой, пока смена не подтвердится
+        или не опровергнется.
+        """
+        reprobe = False
+        try:
+            probe = await self._check_limited(target)
+            self._checks_done += 1
+            # Пока шла проверка, цель могли убрать из мониторинга
+            if probe is None or self._targets.get(target.key) is not target:
+                return
+            if probe.port:
+                target.last_port = probe.port
+            reprobe = target.observe(probe.is_online)
+
+            for server in list(target.servers.values()):
+                try:
+                    await self._apply_result(server, replace(probe, server_id=server.id), target.confirmed)
+                except Exception as e:
+                    logger.error(f"Error handling check for server {server.id}: {e}")
+        finally:
+            target.in_flight = False
+            if reprobe and self._targets.get(target.key) is target:
+                self._schedule_reprobe(target)
+
+    def _schedule_reprobe(self, target: _Target):
+        delay = min(MONITORING_REPROBE_SECONDS * 2 ** (target.retries - 1), target.interval)
+        due = time.monotonic() + delay
+        if due < target.regular_due:
+            target.due = due
+            self._push(target)
+            self._wakeup.set()
+
+    async def _apply_result(self, server: Server, check: MonitorCheck, is_online: bool):
+        """Обновляет статус сервера по результату проверки и подтверждённому статусу цели."""
+        state = self.states.get(server.id)
+        if state is None:
+            state = MonitorState(
+                server_id=server.id,
+                is_online=is_online,
+                changed_at=check.checked_at,
+                checked_at=check.checked_at
+            )
+            self.states[server.id] = state
+        elif state.is_online != is_online:
+            # Статус изменился
+            state.is_online = is_online
+            state.changed_at = check.checked_at
+            self._pending_alerts.append(OutboxMessage(
+                chat_id=server.user_id,
+                kind="status",
+                dedupe_key=f"status:{server.id}:{check.checked_at.isoformat()}",
+                server_id=server.id,
+                is_online=is_online
+            ))
+            # Смену статуса не держим до планового сброса
+            self._flush_now.set()
+
+        state.checked_at = check.checked_at
+        if check.port:
+            state.last_port = check.port
+        self._record(check, state)
+
+    # === Запись результатов ===
+
+    def _record(self, check: MonitorCheck, state: MonitorState):
+        """Копит результат для пакетной записи в базу."""
+        self._pending_checks.append(check)
+        self._dirty_states[state.server_id] = state
+        self._add_sample(check)
+        if len(self._pending_checks) >= MONITORING_FLUSH_BATCH:
+            self._flush_now.set()
+
+    async def flush(self):
+        """Записывает накопленные результаты и уведомления одной транзакцией."""
+        if not self._pending_checks and not self._dirty_states:
+            return
+        checks, self._pending_checks = self._pending_checks, []
+        states, self._dirty_states = list(self._dirty_states.values()), {}
+        alerts, self._pending_alerts = self._pending_alerts, []
+        try:
+            await db.save_monitor_results(checks, states, alerts)
+        except Exception as e:
+            logger.error(f"Failed to save {len(checks)} monitoring results: {e}")
+            # Уведомления не теряем: уйдут со следующей пачкой
+            self._pending_alerts = alerts + self._pending_alerts
+            return
+        if alerts:
+            self.outbox.wake()
+
+    async def _flush_loop(self):
+        while self.running:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), MONITORING_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+            try:
+                await self._rollup()
             except Exception as e:
-                logger.error(f"Error in monitoring loop: {e}")
+                logger.error(f"Failed to save monitoring rollups: {e}")
 
-            await asyncio.sleep(MONITORING_INTERVAL_MINUTES * 60)
+    # === Агрегаты ===
 
-    async def _check_all_servers(self):
-        """Проверяет все серверы с включённым мониторингом."""
-        servers = await db.get_servers_for_monitoring()
-        logger.info(f"Checking {len(servers)} servers")
+    def _add_sample(self, check: MonitorCheck):
+        samples = self._samples.get(check.server_id)
+        if samples is None:
+            interval = MONITORING_INTERVAL_MINUTES * 60
+            # Запас вдвое на внеочередные проверки
+            maxlen = max(16, math.ceil(_SAMPLE_HOURS * 3600 / interval) * 2)
+            samples = deque(maxlen=maxlen)
+            self._samples[check.server_id] = samples
+        samples.append((check.checked_at, check.latency_ms, check.is_online))
 
-        for server in servers:
-            is_online = await self._check_server(server)
-            prev_status = self.server_status.get(server.id)
+    async def _restore_samples(self):
+        """Заполняет буферы из истории, чтобы рестарт не терял текущий час."""
+        hour = _utcnow().replace(minute=0, second=0, microsecond=0)
+        # Прошлый час пересчитывается заново: запись идемпотентна,
+        # а предыдущий процесс мог не успеть его сохранить
+        self._rolled_until = hour - timedelta(hours=1)
+        try:
+            checks = await db.get_recent_checks(hour - timedelta(hours=_SAMPLE_HOURS - 1))
+        except Exception as e:
+            logger.error(f"Failed to restore monitoring samples: {e}")
+            return
+        for check in checks:
+            self._add_sample(check)
+
+    async def _rollup(self):
+        """Считает агрегаты за завершившиеся часы и сохраняет их."""
+        hour = _utcnow().replace(minute=0, second=0, microsecond=0)
+        if self._rolled_until is None or self._rolled_until >= hour:
+            return
+
+        # Старше буфера данных в памяти уже нет
+        start = max(self._rolled_until, hour - timedelta(hours=_SAMPLE_HOURS - 1))
+        rollups = []
+        while start < hour:
+            end = start + timedelta(hours=1)
+            for server_id, samples in self._samples.items():
+                rollup = _make_rollup(server_id, start, [s for s in samples if start <= s[0] < end])
+                if rollup:
+                    rollups.append(rollup)
+            start = end
 
-            if prev_status is not None and prev_status != is_online:
-                # Статус изменился
-                await self._notify_status_change(server, is_online)
+        if rollups:
+            await db.save_hourly_rollups(rollups)
+        self._rolled_until = hour
 
-            self.server_status[server.id] = is_online
+    async def _check_limited(self, target: _Target) -> Optional[MonitorCheck]:
+        """Проверяет цель с учётом общего лимита и лимита пользователя.
 
-    async def _check_server(self, server: Server) -> bool:
-        """Проверяет доступность сервера."""
-        if server.url:
+        Общая цель учитывается в лимите первого подписанного пользователя.
+        """
+        server = next(iter(target.servers.values()))
+        user_limit = self._user_limits.get(server.user_id)
+        if user_limit is None:
+            user_limit = asyncio.Semaphore(MONITORING_MAX_PER_USER)
+            self._user_limits[server.user_id] = user_limit
+
+        # Сначала лимит пользователя: ожидающие проверки одного
+        # пользователя не занимают общие слоты
+        async with user_limit:
+            async with self._global_limit:
+                try:
+                    return await self._check_target(target)
+                except Exception as e:
+                    logger.error(f"Check failed for target {target.key[1]}: {e}")
+                    return None
+
+    async def _check_target(self, target: _Target) -> MonitorCheck:
+        """Проверяет доступность адреса.
+
+        server_id в результате не заполнен — его проставляет раздача подписчикам.
+        """
+        check = MonitorCheck(server_id=0, checked_at=_utcnow(), is_online=False)
+        started = time.monotonic()
+
+        if target.key[0] == "url":
+            url = target.key[1]
             # Проверка безопасности URL
-            is_safe, _ = is_safe_url(server.url)
+            is_safe, _ = is_safe_url(url)
             if not is_safe:
-                logger.warning(f"Skipping unsafe URL for server {server.id}: {server.url}")
-                return False
-            return await self._check_url(server.url)
-        elif server.ip:
+                logger.warning(f"Skipping unsafe URL: {url}")
+                return check
+            check.http_status = await self._check_url(url)
+            check.is_online = check.http_status is not None and check.http_status < 500
+        else:
+            ip = target.key[1]
             # Проверка безопасности IP
-            is_safe, _ = is_safe_ip_for_monitoring(server.ip)
+            is_safe, _ = is_safe_ip_for_monitoring(ip)
             if not is_safe:
-                logger.warning(f"Skipping unsafe IP for server {server.id}: {server.ip}")
-                return False
-            return await self._check_ip(server.ip)
-        return False
+                logger.warning(f"Skipping unsafe IP: {ip}")
+                return check
+            check.port = await self._check_ip(ip, self._ports_for(target))
+            check.is_online = check.port is not None
+
+        if check.is_online:
+            check.latency_ms = (time.monotonic() - started) * 1000
+        return check
 
-    async def _check_url(self, url: str) -> bool:
-        """Проверяет доступность URL."""
-        if not url.startswith(('http://', 'https://')):
-            url = f'https://{url}'
+    def _ports_for(self, target: _Target) -> list[int]:
+        """Порты для проверки: настроенные для цели, последний ответивший — первым."""
+        ports = list(target.ports)
+        if target.last_port in ports:
+            ports.remove(target.last_port)
+            ports.insert(0, target.last_port)
+        return ports
 
+    async def _check_url(self, url: str) -> Optional[int]:
+        """Проверяет доступность URL, возвращает HTTP-код или None без ответа."""
         try:
-            timeout = aiohttp.ClientTimeout(total=MONITORING_TIMEOUT_SECONDS)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(url) as response:
-                    return response.status < 500
+            async with self._session.get(url) as response:
+                return response.status
         except Exception as e:
             logger.debug(f"URL check failed for {url}: {e}")
-            return False
+            return None
 
-    async def _check_ip(self, ip: str) -> bool:
-        """Проверяет доступность IP (TCP connect на порт 80 или 443)."""
-        for port in [443, 80, 22]:
-            try:
-                _, writer = await asyncio.wait_for(
-                    asyncio.open_connection(ip, port),
-                    timeout=MONITORING_TIMEOUT_SECONDS
-                )
-                writer.close()
-                await writer.wait_closed()
-                return True
-            except Exception:
-                continue
-        return False
-
-    async def _notify_status_change(self, server: Server, is_online: bool):
-        """Отправляет уведомление об изменении статуса."""
-        if is_online:
-            status = "🟢 ОНЛАЙН"
-            header = "✅ Сервер снова доступен"
-        else:
-            status = "🔴 НЕДОСТУПЕН"
-            header = "⚠️ Сервер недоступен"
-
-        text = (
-            f"┌{'─' * 26}\n"
-            f"│ {header}\n"
-            f"├{'─' * 26}\n"
-            f"│ 🖥 <b>{server.name}</b>\n"
-            f"│ 🏢 {server.hosting}\n"
-            f"│ 📡 Статус: {status}\n"
-        )
+    async def _check_ip(self, ip: str, ports: list[int]) -> Optional[int]:
+        """Проверяет доступность IP по TCP, возвращает ответивший порт.
+
+        Порты пробуются параллельно по схеме «happy eyeballs»: следующая
+        попытка стартует через MONITORING_PORT_STAGGER_MS или сразу после
+        неудачи предыдущей. Первый успех побеждает, остальные отменяются,
+        так что худший случай — один таймаут, а не по таймауту на порт.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + MONITORING_TIMEOUT_SECONDS
+        stagger = MONITORING_PORT_STAGGER_MS / 1000
+        queue = list(ports)
+        attempts: Dict[asyncio.Task, int] = {}
+        pending: set[asyncio.Task] = set()
+
+        try:
+            while queue or pending:
+                if queue:
+                    port = queue.pop(0)
+                    task = asyncio.create_task(self._probe_port(ip, port))
+                    attempts[task] = port
+                    pending.add(task)
+
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                if queue:
+                    timeout = min(timeout, stagger)
 
-        if server.ip:
-            text += f"│ 🌐 <code>{server.ip}</code>\n"
-        if server.url:
-            text += f"│ 🔗 {server.url}\n"
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.result():
+                        return attempts[task]
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
 
-        text += f"└{'─' * 26}"
+        return None
 
+    async def _probe_port(self, ip: str, port: int) -> bool:
+        """Одна попытка TCP connect."""
         try:
-            await self.bot.send_message(server.user_id, text, parse_mode="HTML")
-            logger.info(f"Sent status notification for server {server.id} to user {server.user_id}")
-        except Exception as e:
-            logger.error(f"Failed to send status notification: {e}")
+            _, writer = await asyncio.open_connection(ip, port)
+            writer.close()
+            await writer.wait_closed()
+            return True
+        except Exception:
+            return False
+
+
+def _target_key(server: Server) -> _TargetKey:
+    """Нормализованный адрес сервера: одинаковые адреса дают одинаковый ключ."""
+    if server.url:
+        return ("url", _canonical_url(server.url))
+    ports = parse_ports(server.monitoring_ports or "") or list(MONITORING_DEFAULT_PORTS)
+    return ("ip", server.ip.strip(), tuple(sorted(set(ports))))
+
+
+def _canonical_url(url: str) -> str:
+    """Приводит URL к одному виду: схема по умолчанию https, хост в нижнем регистре,
+    без порта по умолчанию и фрагмента. Логин и пароль сохраняются как есть."""
+    url = url.strip()
+    if not url.lower().startswith(('http://', 'https://')):
+        url = f'https://{url}'
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    userinfo, at, host = parts.netloc.rpartition('@')
+    host = host.lower()
+    default_port = {"http": ":80", "https": ":443"}[scheme]
+    if host.endswith(default_port):
+        host = host[:-len(default_port)]
+    return urlunsplit((scheme, userinfo + at + host, parts.path or "/", parts.query, ""))
+
+
+def _make_rollup(server_id: int, bucket_start: datetime, samples: list[_Sample]) -> Optional[UptimeRollup]:
+    """Агрегат часа: аптайм и min/avg/p95 задержки по успешным проверкам."""
+    if not samples:
+        return None
+    latencies = sorted(latency for _, latency, ok in samples if ok and latency is not None)
+    rollup = UptimeRollup(
+        server_id=server_id,
+        period="hour",
+        bucket_start=bucket_start,
+        checks=len(samples),
+        up=sum(1 for _, _, ok in samples if ok),
+        min_ms=None,
+        avg_ms=None,
+        p95_ms=None
+    )
+    if latencies:
+        rollup.min_ms = latencies[0]
+        rollup.avg_ms = sum(latencies) / len(latencies)
+        # Метод ближайшего ранга
+        rollup.p95_ms = latencies[math.ceil(0.95 * len(latencies)) - 1]
+    return rollup
+
+
+def _utcnow() -> datetime:
+    """Текущее время UTC без tzinfo — в том же виде, что CURRENT_TIMESTAMP в SQLite."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
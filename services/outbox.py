@@ -0,0 +1,185 @@
+import logging
+import asyncio
+import time
+from typing import Dict, Optional
+
+from database import db, OutboxMessage, Server
+from config import (
+    OUTBOX_POLL_SECONDS, OUTBOX_BATCH, OUTBOX_MAX_ATTEMPTS, OUTBOX_KEEP_DAYS,
+    MONITORING_DIGEST_SECONDS, DELIVERY_DRAIN_SECONDS
+)
+from utils import format_status_change, format_status_digest
+from services.delivery import (
+    DeliveryService, PRIORITY_ALERT, PRIORITY_REMINDER, DELIVERED, REJECTED
+)
+
+logger = logging.getLogger(__name__)
+
+# Как часто чистить отправленные записи, сек
+_PRUNE_INTERVAL = 3600
+# Сколько записей может одновременно ждать доставки
+_MAX_IN_FLIGHT = OUTBOX_BATCH * 10
+
+
+class OutboxDrainer:
+    """Отправляет уведомления из таблицы outbox.
+
+    Запись помечается отправленной только после доставки, поэтому рестарт
+    в любой момент ничего не теряет; в худшем случае сообщение, доставленное
+    перед самым падением, уйдёт повторно. Каждая запись отмечается, как
+    только известен итог её доставки: чат под флуд-контролем не задерживает
+    уведомления остальных пользователей.
+    """
+
+    def __init__(self, delivery: DeliveryService):
+        self.delivery = delivery
+        self.running = False
+        self._task = None
+        self._wakeup = asyncio.Event()
+        # Записи, отданные в DeliveryService, и задачи, ждущие их итога
+        self._in_flight: set[int] = set()
+        self._finishing: set[asyncio.Task] = set()
+
+    async def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._task = asyncio.create_task(self._drain_loop())
+        logger.info("Outbox drainer started")
+
+    async def stop(self):
+        """Останавливается, дождавшись итогов отправки не дольше DELIVERY_DRAIN_SECONDS.
+
+        Записи без итога остаются в очереди и уйдут после рестарта.
+        """
+        self.running = False
+        self._wakeup.set()
+        if self._task:
+            await self._task
+        if self._finishing:
+            _, pending = await asyncio.wait(self._finishing, timeout=DELIVERY_DRAIN_SECONDS)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            if pending:
+                logger.warning(f"Outbox stopped with {len(pending)} deliveries unconfirmed, they stay pending")
+        logger.info("Outbox drainer stopped")
+
+    def wake(self):
+        """Сообщает о новых записях, чтобы не ждать очередного опроса."""
+        self._wakeup.set()
+
+    async def _drain_loop(self):
+        next_prune = 0.0
+        while self.running:
+            try:
+                if time.monotonic() >= next_prune:
+                    await db.prune_outbox(OUTBOX_KEEP_DAYS)
+                    next_prune = time.monotonic() + _PRUNE_INTERVAL
+                drained = await self.drain()
+            except Exception as e:
+                logger.error(f"Error draining outbox: {e}")
+                drained = 0
+
+            # Полная пачка — за ней, скорее всего, есть ещё
+            if drained >= OUTBOX_BATCH or not self.running:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain(self) -> int:
+        """Отдаёт в доставку одну пачку, возвращает число взятых записей.
+
+        Итог доставки не ждётся: каждая запись отмечается в базе отдельно,
+        когда он станет известен.
+        """
+        if len(self._in_flight) >= _MAX_IN_FLIGHT:
+            return 0
+        messages = await db.get_pending_outbox(
+            MONITORING_DIGEST_SECONDS, OUTBOX_BATCH, skip_ids=self._in_flight
+        )
+        if not messages:
+            return 0
+
+        skipped: list[int] = []
+
+        status_by_chat: Dict[int, list[OutboxMessage]] = {}
+        for message in messages:
+            if message.kind == "status":
+                status_by_chat.setdefault(message.chat_id, []).append(message)
+            else:
+                future = self.delivery.send(
+                    message.chat_id, message.text, priority=PRIORITY_REMINDER, parse_mode="HTML"
+                )
+                self._track([message.id], message.chat_id, future)
+
+        servers = await db.get_servers_by_ids(
+            list({m.server_id for items in status_by_chat.values() for m in items})
+        )
+        for chat_id, items in status_by_chat.items():
+            ids = [m.id for m in items]
+            text = _render_status_changes(items, servers)
+            if text is None:
+                skipped.extend(ids)
+                continue
+            future = self.delivery.send(chat_id, text, priority=PRIORITY_ALERT, parse_mode="HTML")
+            self._track(ids, chat_id, future)
+
+        if skipped:
+            await db.mark_outbox(skipped, [], OUTBOX_MAX_ATTEMPTS)
+        return len(messages)
+
+    def _track(self, ids: list[int], chat_id: int, future: asyncio.Future):
+        self._in_flight.update(ids)
+        task = asyncio.create_task(self._finish(ids, chat_id, future))
+        self._finishing.add(task)
+        task.add_done_callback(self._finishing.discard)
+
+    async def _finish(self, ids: list[int], chat_id: int, future: asyncio.Future):
+        """Отмечает записи по итогу доставки."""
+        try:
+            # shield: отмена при остановке не должна отменять само сообщение
+            outcome = await asyncio.shield(future)
+            if outcome == DELIVERED:
+                await db.mark_outbox(ids, [], OUTBOX_MAX_ATTEMPTS)
+            elif outcome == REJECTED:
+                await db.mark_outbox([], [], OUTBOX_MAX_ATTEMPTS, rejected_ids=ids)
+            else:
+                await db.mark_outbox([], ids, OUTBOX_MAX_ATTEMPTS)
+                logger.warning(f"Outbox: {len(ids)} notifications to {chat_id} not delivered, will retry")
+        except Exception as e:
+            logger.error(f"Error marking outbox notifications {ids}: {e}")
+        finally:
+            saturated = len(self._in_flight) >= _MAX_IN_FLIGHT
+            self._in_flight.difference_update(ids)
+            if saturated:
+                self._wakeup.set()
+
+
+def _render_status_changes(items: list[OutboxMessage], servers: Dict[int, Server]) -> Optional[str]:
+    """Собирает смены статуса пользователя в одно сообщение.
+
+    Сервер, вернувшийся в исходный статус, и удалённые серверы пропускаются.
+    """
+    by_server: Dict[int, list[OutboxMessage]] = {}
+    for item in items:
+        by_server.setdefault(item.server_id, []).append(item)
+
+    changes = []
+    for server_id, server_items in by_server.items():
+        server = servers.get(server_id)
+        first, last = server_items[0], server_items[-1]
+        # Каждая запись — смена, значит до первой статус был противоположным,
+        # и итог отличается от него, только если последняя совпадает с первой
+        if server is None or last.is_online != first.is_online:
+            continue
+        changes.append((server, last.is_online))
+
+    if not changes:
+        return None
+    if len(changes) == 1:
+        return format_status_change(*changes[0])
+    return format_status_digest(changes)
@@ -1,63 +1,128 @@
 import logging
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
 from collections import defaultdict
+from typing import Dict, Optional
+from zoneinfo import ZoneInfo
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from aiogram import Bot
 
-from database import db, Server
+from config import DEFAULT_TIMEZONE
+from database import db, OutboxMessage
 from utils import format_reminder
+from services.outbox import OutboxDrainer
 
 logger = logging.getLogger(__name__)
 
 
-async def check_reminders(bot: Bot):
-    """Проверяет серверы и отправляет напоминания пользователям."""
-    logger.info("Checking reminders...")
+# Напоминания пишутся в outbox пачками такого размера
+_ENQUEUE_BATCH = 500
 
-    try:
-        users = await db.get_all_users_with_settings()
+# Момент (UTC), до которого напоминания пояса уже поставлены: следующая
+# проверка берёт пользователей, чьё время наступило после него. Курсор
+# двигается только после успешной постановки, иначе окно повторится;
+# None — пояс ещё ни разу не обработан и догоняет весь сегодняшний день
+_last_check: Dict[str, Optional[datetime]] = {}
+# Начало предыдущей проверки — с него стартует впервые встреченный пояс
+_last_run: Optional[datetime] = None
+
+
+async def check_reminders(outbox: OutboxDrainer):
+    """Ставит в outbox напоминания пользователей, чьё время наступило.
+
+    Запускается раз в минуту и берёт только пользователей, у которых
+    reminder_time по их часовому поясу попал в прошедшую минуту. Первый
+    запуск после старта догоняет всех, чьё время сегодня уже прошло:
+    outbox не даст отправить напоминание дважды за день.
+    """
+    global _last_run
+    now = datetime.now(timezone.utc)
+
+    queued = 0
+    for tz_name in db.get_reminder_timezones():
+        since = _last_check.get(tz_name, _last_run)
+        try:
+            queued += await _queue_timezone(tz_name, since, now)
+        except Exception as e:
+            logger.error(f"Error queueing reminders for {tz_name}: {e}")
+            _last_check[tz_name] = since
+            continue
+        _last_check[tz_name] = now
+    _last_run = now
 
-        for user_settings in users:
-            user_id = user_settings.user_id
-            days = user_settings.reminder_days
+    if queued:
+        logger.info(f"Queued {queued} reminders")
+        outbox.wake()
 
-            servers = await db.get_servers_for_reminder(days)
-            user_servers = [s for s in servers if s.user_id == user_id]
 
-            if user_servers:
-                text = format_reminder(user_servers)
-                try:
-                    await bot.send_message(user_id, text, parse_mode="HTML")
-                    logger.info(f"Sent reminder to user {user_id} for {len(user_servers)} servers")
-                except Exception as e:
-                    logger.error(f"Failed to send reminder to {user_id}: {e}")
+async def _queue_timezone(tz_name: str, since: Optional[datetime], now: datetime) -> int:
+    """Ставит напоминания пояса за интервал (since, now]; since=None — за весь сегодняшний день."""
+    tz = _zone(tz_name)
+    local_now = now.astimezone(tz)
+    until = local_now.strftime("%H:%M")
+    local_since = since.astimezone(tz) if since is not None else None
+    if local_since is None or local_since.date() < local_now.date() - timedelta(days=1):
+        windows = [(local_now.date(), "", until)]
+    elif local_since.date() == local_now.date():
+        windows = [(local_now.date(), local_since.strftime("%H:%M"), until)]
+    else:
+        # Проверки разделила полночь
+        windows = [
+            (local_since.date(), local_since.strftime("%H:%M"), "24:00"),
+            (local_now.date(), "", until)
+        ]
 
-    except Exception as e:
-        logger.error(f"Error in check_reminders: {e}")
+    queued = 0
+    for today, after, until in windows:
+        if after < until:
+            queued += await _queue_reminders(tz_name, after, until, today)
+    return queued
+
+
+async def _queue_reminders(tz_name: str, after: str, until: str, today: date) -> int:
+    batch: list[OutboxMessage] = []
+    queued = 0
+    async for user_id, user_servers in db.iter_reminder_batches(tz_name, after, until, today):
+        batch.append(OutboxMessage(
+            chat_id=user_id,
+            kind="reminder",
+            dedupe_key=f"reminder:{user_id}:{today.isoformat()}",
+            text=format_reminder(user_servers, today)
+        ))
+        if len(batch) >= _ENQUEUE_BATCH:
+            queued += await db.enqueue_outbox(batch)
+            batch = []
+    queued += await db.enqueue_outbox(batch)
+    return queued
+
+
+def _zone(name: str) -> ZoneInfo:
+    try:
+        return ZoneInfo(name)
+    except Exception:
+        logger.error(f"Unknown timezone {name}, using {DEFAULT_TIMEZONE}")
+        return ZoneInfo(DEFAULT_TIMEZONE)
 
 
-def setup_scheduler(bot: Bot) -> AsyncIOScheduler:
+def setup_scheduler(outbox: OutboxDrainer) -> AsyncIOScheduler:
     """Настраивает и возвращает планировщик."""
     scheduler = AsyncIOScheduler()
 
-    # Проверка напоминаний каждый день в 10:00
+    # Каждую минуту — напоминания пользователей, чьё время наступило
     scheduler.add_job(
         check_reminders,
         'cron',
-        hour=10,
-        minute=0,
-        args=[bot],
+        minute='*',
+        args=[outbox],
         id='check_reminders',
         replace_existing=True
     )
 
-    # Также проверяем при запуске
+    # При запуске — сразу, с досылкой пропущенных за сегодня
     scheduler.add_job(
         check_reminders,
         'date',
         run_date=datetime.now(),
-        args=[bot],
+        args=[outbox],
         id='initial_check',
         replace_existing=True
     )
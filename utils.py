@@ -1,5 +1,8 @@
 from datetime import date
-from database import Server
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+from database import Server, ServerFilter, ServerPage, SpendAggregate, UptimeSummary, UserSettings, UserSummary
 from config import EXCHANGE_RATES
 
 
@@ -72,7 +75,11 @@ def get_progress_bar(days_left: int, max_days: int = 30) -> str:
     return f"{bar} {int(percentage)}%"
 
 
-def format_server_info(server: Server, detailed: bool = False) -> str:
+def format_server_info(
+    server: Server,
+    detailed: bool = False,
+    uptime: Optional[UptimeSummary] = None
+) -> str:
     """Форматирует карточку сервера."""
     days_left = (server.expiry_date - date.today()).days
     status_emoji = get_status_emoji(days_left)
@@ -102,6 +109,8 @@ def format_server_info(server: Server, detailed: bool = False) -> str:
         extras = []
         if server.url:
             extras.append(f"├ 🔗 {server.url}")
+        if server.monitoring_ports:
+            extras.append(f"├ 🔌 Порты: {server.monitoring_ports.replace(',', ', ')}")
         if server.notes:
             extras.append(f"├ 📝 {server.notes}")
         if server.tags:
@@ -114,52 +123,102 @@ def format_server_info(server: Server, detailed: bool = False) -> str:
                 extras[-1] = extras[-1].replace("├", "└", 1)
             text += "\n".join(extras)
 
-    return text
-
+        if uptime:
+            text = text.rstrip("\n") + "\n\n📡 <b>Мониторинг</b>\n"
+            text += f"├ Аптайм 24ч: {_format_percent(uptime.uptime_24h)}\n"
+            text += f"├ Аптайм 30д: {_format_percent(uptime.uptime_30d)}\n"
+            text += f"└ Отклик: {_format_latency(uptime.avg_ms_24h, uptime.p95_ms_24h)}"
 
-def format_server_list(servers: list[Server]) -> str:
-    """Форматирует список серверов."""
-    return format_server_list_sorted(servers, "date")
+    return text
 
 
-def format_server_list_sorted(servers: list[Server], sort_by: str = "date") -> str:
-    """Форматирует список серверов с сортировкой."""
-    if not servers:
+def format_main_menu(summary: UserSummary) -> str:
+    """Форматирует приветствие главного меню по сводке пользователя."""
+    if summary.total > 0:
+        stats_text = f"📊 Серверов: <b>{summary.total}</b>"
+        if summary.attention > 0:
+            stats_text += f"\n⚠️ Требуют внимания: <b>{summary.attention}</b>"
+            buckets = []
+            if summary.overdue:
+                buckets.append(f"❗ {summary.overdue} просрочено")
+            if summary.urgent:
+                buckets.append(f"🔴 {summary.urgent} до 3 дн.")
+            if summary.soon:
+                buckets.append(f"🟠 {summary.soon} до 7 дн.")
+            stats_text += "\n" + " • ".join(buckets)
+        if summary.monthly_spend:
+            spend = " + ".join(
+                f"{amount:.0f} {currency}" for currency, amount in sorted(summary.monthly_spend.items())
+            )
+            stats_text += f"\n💳 В месяц: {spend}"
+        if summary.next_expiry:
+            server = summary.next_expiry
+            stats_text += (
+                f"\n📅 Ближайшая оплата: {server.expiry_date.strftime('%d.%m')} — {server.name}"
+            )
+    else:
+        stats_text = "👋 Добавьте первый сервер"
+
+    return (
+        f"🖥 <b>Server Manager</b>\n"
+        f"━━━━━━━━━━━━━━━━━━━━━━\n\n"
+        f"{stats_text}\n\n"
+        f"━━━━━━━━━━━━━━━━━━━━━━"
+    )
+
+
+def format_filter(filters: ServerFilter) -> str:
+    """Краткое описание активного фильтра списка."""
+    parts = []
+    if filters.hosting is not None:
+        parts.append(f"🏢 {filters.hosting}")
+    if filters.location is not None:
+        parts.append(f"📍 {filters.location}")
+    if filters.tag is not None:
+        parts.append(f"🏷 {filters.tag}")
+    if filters.due_days is not None and filters.due_days < 0:
+        parts.append("❗ просрочены")
+    elif filters.due_days is not None:
+        parts.append(f"⏰ до {filters.due_days} дн.")
+    return " • ".join(parts)
+
+
+def format_server_list_page(
+    page: ServerPage,
+    summary: UserSummary,
+    sort_by: str = "date",
+    filters: Optional[ServerFilter] = None
+) -> str:
+    """Форматирует страницу списка серверов, уже отсортированную и отфильтрованную базой."""
+    if summary.total == 0:
         return (
             "📋 <b>Нет серверов</b>\n\n"
             "Нажмите <b>➕ Добавить</b> чтобы\n"
             "добавить первый сервер"
         )
 
-    # Считаем статистику
-    total = len(servers)
-    urgent = sum(1 for s in servers if (s.expiry_date - date.today()).days <= 7)
-
     sort_names = {"date": "по дате", "hosting": "по хостингу", "location": "по локации"}
     sort_name = sort_names.get(sort_by, "по дате")
 
-    text = f"📋 <b>Мои серверы</b> ({total})\n"
-    if urgent > 0:
-        text += f"⚠️ Требуют внимания: {urgent}\n"
+    text = f"📋 <b>Мои серверы</b> ({summary.total})\n"
+    if summary.attention > 0:
+        text += f"⚠️ Требуют внимания: {summary.attention}\n"
+    if filters and filters.active:
+        text += f"🔎 {format_filter(filters)}\n"
     text += "━━━━━━━━━━━━━━━━━━━━━━\n"
 
-    # Сортируем по выбранному критерию
-    if sort_by == "hosting":
-        sorted_servers = sorted(servers, key=lambda s: (s.hosting.lower(), (s.expiry_date - date.today()).days))
-    elif sort_by == "location":
-        sorted_servers = sorted(servers, key=lambda s: ((s.location or "zzz").lower(), (s.expiry_date - date.today()).days))
-    else:  # date
-        sorted_servers = sorted(servers, key=lambda s: (s.expiry_date - date.today()).days)
+    if not page.servers:
+        text += "\n📭 Ничего не найдено\n"
 
     current_group = None
-    for server in sorted_servers:
+    for server in page.servers:
         days_left = (server.expiry_date - date.today()).days
         status_emoji = get_status_emoji(days_left)
         status_text = get_status_text(days_left)
         period_text = get_period_text(server.payment_period)
 
         # Показываем заголовок группы при сортировке
-        if sort_by == "hosting" and current_group != server.hosting:
+        if sort_by == "hosting" and (current_group or "").lower() != server.hosting.lower():
             current_group = server.hosting
             text += f"\n🏢 <b>{server.hosting}</b>\n"
         elif sort_by == "location":
@@ -226,56 +285,33 @@ def format_expiring_servers(servers: list[Server]) -> str:
     return text
 
 
-def format_stats(servers: list[Server]) -> str:
-    """Форматирует статистику расходов."""
-    if not servers:
+def format_stats(aggregates: list[SpendAggregate]) -> str:
+    """Форматирует статистику расходов по агрегатам из get_spend_aggregates."""
+    if not aggregates:
         return "📊 <b>Статистика</b>\n\n📭 Нет данных — добавьте серверы"
 
     monthly_by_currency: dict[str, float] = {}
     yearly_by_currency: dict[str, float] = {}
     by_hosting: dict[str, int] = {}
+    total_servers = 0
     total_monthly_rub = 0.0
     total_yearly_rub = 0.0
 
-    for server in servers:
-        currency = server.currency
-
-        if server.payment_period == "monthly":
-            monthly = server.price
-            yearly = server.price * 12
-        elif server.payment_period == "quarterly":
-            monthly = server.price / 3
-            yearly = server.price * 4
-        elif server.payment_period == "halfyear":
-            monthly = server.price / 6
-            yearly = server.price * 2
-        elif server.payment_period == "yearly":
-            monthly = server.price / 12
-            yearly = server.price
-        elif server.payment_period and server.payment_period.startswith("custom_"):
-            try:
-                months = int(server.payment_period.split("_")[1])
-                monthly = server.price / months
-                yearly = monthly * 12
-            except (IndexError, ValueError):
-                monthly = server.price
-                yearly = server.price * 12
-        else:
-            monthly = server.price
-            yearly = server.price * 12
-
-        monthly_by_currency[currency] = monthly_by_currency.get(currency, 0) + monthly
-        yearly_by_currency[currency] = yearly_by_currency.get(currency, 0) + yearly
+    for item in aggregates:
+        currency = item.currency
+        monthly_by_currency[currency] = monthly_by_currency.get(currency, 0) + item.monthly
+        yearly_by_currency[currency] = yearly_by_currency.get(currency, 0) + item.yearly
 
         # Конвертируем в рубли для итого
-        total_monthly_rub += convert_to_rub(monthly, currency)
-        total_yearly_rub += convert_to_rub(yearly, currency)
+        total_monthly_rub += convert_to_rub(item.monthly, currency)
+        total_yearly_rub += convert_to_rub(item.yearly, currency)
 
-        by_hosting[server.hosting] = by_hosting.get(server.hosting, 0) + 1
+        by_hosting[item.hosting] = by_hosting.get(item.hosting, 0) + item.servers
+        total_servers += item.servers
 
     text = f"📊 <b>Статистика</b>\n"
     text += f"├{'─' * 24}\n"
-    text += f"│ 🖥 Всего серверов: <b>{len(servers)}</b>\n"
+    text += f"│ 🖥 Всего серверов: <b>{total_servers}</b>\n"
     text += f"├{'─' * 24}\n"
 
     text += "│ 💳 <b>Ежемесячно:</b>\n"
@@ -301,17 +337,145 @@ def format_stats(servers: list[Server]) -> str:
     return text
 
 
-def format_reminder(servers: list[Server]) -> str:
-    """Форматирует напоминание об оплате."""
+def format_uptime(servers: list[Server], summaries: dict[int, UptimeSummary]) -> str:
+    """Форматирует сводку аптайма по серверам с мониторингом."""
+    monitored = [s for s in servers if s.is_monitoring]
+    if not monitored:
+        return (
+            "📡 <b>Аптайм</b>\n\n"
+            "📭 Нет серверов с мониторингом\n"
+            "Включите его в карточке сервера"
+        )
+
+    # Сначала худшие по аптайму за сутки, без данных — в конце
+    def sort_key(server: Server):
+        summary = summaries.get(server.id)
+        if summary is None or summary.uptime_24h is None:
+            return (1, 0.0, server.name.lower())
+        return (0, summary.uptime_24h, server.name.lower())
+
+    text = f"📡 <b>Аптайм</b> ({len(monitored)})\n"
+    text += "━━━━━━━━━━━━━━━━━━━━━━\n"
+
+    for server in sorted(monitored, key=sort_key):
+        summary = summaries.get(server.id)
+        text += f"\n🖥 <b>{server.name}</b>\n"
+        if summary is None:
+            text += "    ⏳ Данных пока нет\n"
+            continue
+        text += (
+            f"    24ч: {_format_percent(summary.uptime_24h)} • "
+            f"30д: {_format_percent(summary.uptime_30d)}\n"
+        )
+        text += f"    ⚡ {_format_latency(summary.avg_ms_24h, summary.p95_ms_24h)}\n"
+
+    return text
+
+
+def _format_percent(value: Optional[float]) -> str:
+    if value is None:
+        return "—"
+    return f"{value:.2f}%"
+
+
+def _format_latency(avg_ms: Optional[float], p95_ms: Optional[float]) -> str:
+    if avg_ms is None:
+        return "—"
+    text = f"{avg_ms:.0f} мс"
+    if p95_ms is not None:
+        text += f" (p95 {p95_ms:.0f} мс)"
+    return text
+
+
+def format_status_change(server: Server, is_online: bool) -> str:
+    """Форматирует уведомление о смене статуса одного сервера."""
+    if is_online:
+        status = "🟢 ОНЛАЙН"
+        header = "✅ Сервер снова доступен"
+    else:
+        status = "🔴 НЕДОСТУПЕН"
+        header = "⚠️ Сервер недоступен"
+
+    text = (
+        f"┌{'─' * 26}\n"
+        f"│ {header}\n"
+        f"├{'─' * 26}\n"
+        f"│ 🖥 <b>{server.name}</b>\n"
+        f"│ 🏢 {server.hosting}\n"
+        f"│ 📡 Статус: {status}\n"
+    )
+
+    if server.ip:
+        text += f"│ 🌐 <code>{server.ip}</code>\n"
+    if server.url:
+        text += f"│ 🔗 {server.url}\n"
+
+    text += f"└{'─' * 26}"
+    return text
+
+
+# Запас до лимита Telegram в 4096 символов
+_MESSAGE_LIMIT = 3800
+
+
+def format_status_digest(changes: list[tuple[Server, bool]]) -> str:
+    """Форматирует сводку смен статуса, сгруппированную по хостингу и локации."""
+    down = sum(1 for _, is_online in changes if not is_online)
+    up = len(changes) - down
+
+    header = "⚠️ <b>Изменение статуса серверов</b>" if down else "✅ <b>Серверы снова доступны</b>"
+    text = f"{header} ({len(changes)})\n"
+    text += "━━━━━━━━━━━━━━━━━━━━━━\n"
+    counters = []
+    if down:
+        counters.append(f"🔴 Недоступны: {down}")
+    if up:
+        counters.append(f"🟢 Доступны: {up}")
+    text += " • ".join(counters) + "\n"
+
+    groups: dict[tuple[str, str], list[tuple[Server, bool]]] = {}
+    for server, is_online in changes:
+        groups.setdefault((server.hosting, server.location or ""), []).append((server, is_online))
+
+    shown = 0
+    for (hosting, location), items in sorted(groups.items(), key=lambda x: (-len(x[1]), x[0])):
+        group_text = f"\n🏢 <b>{hosting}</b>"
+        if location:
+            group_text += f" • 📍 {location}"
+        group_text += "\n"
+        group_shown = 0
+        # Сначала недоступные
+        for server, is_online in sorted(items, key=lambda x: (x[1], x[0].name.lower())):
+            emoji = "🟢" if is_online else "🔴"
+            line = f"  {emoji} {server.name}"
+            if server.ip:
+                line += f" <code>{server.ip}</code>"
+            line += "\n"
+            if len(text) + len(group_text) + len(line) > _MESSAGE_LIMIT:
+                if group_shown:
+                    text += group_text
+                text += f"\n… и ещё {len(changes) - shown}"
+                return text
+            group_text += line
+            group_shown += 1
+            shown += 1
+        text += group_text
+
+    return text
+
+
+def format_reminder(servers: list[Server], today: date | None = None) -> str:
+    """Форматирует напоминание об оплате; today — местная дата пользователя."""
     if not servers:
         return ""
 
+    today = today or date.today()
     text = "🔔 <b>Напоминание об оплате</b>\n\n"
 
     total_by_currency: dict[str, float] = {}
 
     for server in servers:
-        days_left = (server.expiry_date - date.today()).days
+        days_left = (server.expiry_date - today).days
         status_emoji = get_status_emoji(days_left)
 
         if days_left < 0:
@@ -354,6 +518,63 @@ def parse_date(date_str: str) -> date | None:
     return None
 
 
+def format_settings(settings: UserSettings) -> str:
+    """Форматирует экран настроек."""
+    return (
+        f"⚙️ <b>Настройки</b>\n"
+        f"━━━━━━━━━━━━━━━━━━━━\n\n"
+        f"🔔 Напоминать за <b>{settings.reminder_days}</b> дней\n"
+        f"до окончания оплаты\n"
+        f"🕐 В <b>{settings.reminder_time}</b> ({settings.timezone})\n\n"
+        f"Выберите новое значение:"
+    )
+
+
+def parse_reminder_time(time_str: str) -> str | None:
+    """Парсит время напоминания, возвращает его в виде ЧЧ:ММ."""
+    parts = time_str.strip().replace(".", ":").split(":")
+    if len(parts) != 2:
+        return None
+    try:
+        hour, minute = int(parts[0]), int(parts[1])
+    except ValueError:
+        return None
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        return None
+    return f"{hour:02d}:{minute:02d}"
+
+
+def parse_timezone(tz_str: str) -> str | None:
+    """Проверяет название часового пояса IANA (например, Europe/Moscow)."""
+    name = tz_str.strip()
+    if name.upper() == "UTC":
+        return "UTC"
+    if "/" not in name:
+        return None
+    try:
+        ZoneInfo(name)
+    except Exception:
+        return None
+    return name
+
+
+def parse_ports(ports_str: str) -> list[int] | None:
+    """Парсит список TCP-портов через запятую."""
+    ports = []
+    for part in ports_str.replace(" ", "").split(","):
+        if not part:
+            continue
+        try:
+            port = int(part)
+        except ValueError:
+            return None
+        if not 1 <= port <= 65535:
+            return None
+        if port not in ports:
+            ports.append(port)
+    return ports or None
+
+
 def parse_price(price_str: str) -> float | None:
     """Парсит цену из строки."""
     try: